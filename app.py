@@ -2,11 +2,12 @@
 
 import json
 import os
+from functools import lru_cache
 
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_cors import CORS
-from chat import chat_with_bot, get_chat_response
+from chat import chat_with_bot, get_chat_response, stream_chat_response
 from world_journey_ai.db import init_db
 
 import datetime
@@ -28,21 +29,37 @@ FIREBASE_ENV_MAP = {
     'databaseURL': 'FIREBASE_DATABASE_URL',
 }
 
+PAGE_CACHE_CONTROL = 'public, max-age=300'
+
+
+@lru_cache(maxsize=None)
+def _rendered_page(name):
+    """Page templates take no request context, so render each one once per process."""
+    return render_template(name)
+
+
+def _page(name):
+    # Debug mode keeps Jinja's template auto-reload working.
+    html = render_template(name) if app.debug else _rendered_page(name)
+    response = Response(html, mimetype='text/html')
+    response.headers['Cache-Control'] = PAGE_CACHE_CONTROL
+    return response
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return _page('index.html')
 
 @app.route('/chat')
 def chat_page():
-    return render_template('chat.html')
+    return _page('chat.html')
 
 @app.route('/guide')
 def guide_page():
-    return render_template('guide.html')
+    return _page('guide.html')
 
 @app.route('/login')
 def login_page():
-    return render_template('login.html')
+    return _page('login.html')
 
 @app.route('/api/query', methods=['POST'])
 def api_query():
@@ -72,6 +89,46 @@ def api_query():
         return jsonify({'error': str(e)}), 500
 
 
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/query/stream', methods=['POST'])
+def api_query_stream():
+    """Server-sent events: `delta` events as GPT writes, then one `done` event with the full result."""
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+
+    user_message = data['message']
+    user_id = data.get('user_id', 'default')
+
+    def events():
+        try:
+            for delta, result in stream_chat_response(user_message, user_id):
+                if result is None:
+                    yield _sse('delta', {'text': delta})
+                    continue
+                yield _sse('done', {
+                    'success': True,
+                    'response': result['response'],
+                    'structured_data': result.get('structured_data', []),
+                    'language': result.get('language', 'th'),
+                    'intent': result.get('intent'),
+                    'source': result.get('source'),
+                    'tokens_used': result.get('tokens_used'),
+                    'timestamp': datetime.datetime.now().isoformat()
+                })
+        except Exception as e:
+            print(f"[ERROR] /api/query/stream failed: {e}")
+            yield _sse('error', {'error': str(e)})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @app.route('/api/chat', methods=['POST'])
 def api_chat():
     try:
@@ -175,5 +232,7 @@ if __name__ == '__main__':
         print("[OK] Database initialized")
     except Exception as e:
         print(f"[WARN] Database initialization failed: {e}")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only; production runs gunicorn (see gunicorn.conf.py).
+    debug = os.getenv('FLASK_DEBUG', '0').lower() in ('1', 'true', 'yes')
+    app.run(debug=debug, host='0.0.0.0', port=int(os.getenv('PORT', '5000')), threaded=True)
 
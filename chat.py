@@ -4,13 +4,16 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 from world_journey_ai.configs import PromptRepo
 from world_journey_ai.db import get_db, Place
+from world_journey_ai.utils import EMPTY as _EMPTY, THAI_CHAR_RE
 try:
     from world_journey_ai.services.database import get_db_service
     DB_SERVICE_AVAILABLE = True
@@ -39,6 +42,11 @@ except Exception as exc:
     FLEXIBLE_MATCHER_AVAILABLE = False
     FlexibleMatcher = None
 
+try:
+    import ahocorasick
+except ImportError:  # optional: one-pass multi-term matching for local references
+    ahocorasick = None
+
 if TYPE_CHECKING:
     from simple_matcher import FlexibleMatcher as FlexibleMatcherType
 else:
@@ -52,6 +60,15 @@ LOCAL_KEYWORDS = PROMPT_REPO.get_prompt("chatbot/local_terms", default=[
     "samut songkhram"
 ])
 DUPLICATE_WINDOW_SECONDS = 15
+WHITESPACE_RE = re.compile(r"\s+")
+NON_WORD_RE = re.compile(r"[^0-9a-zA-Z\u0E00-\u0E7F]+")
+PROVINCE_RE = re.compile(r'จังหวัด\s*([^\s,.;!?]+)')
+# Scores the query with the local matcher while the request thread waits on the GPT keyword
+# interpretation; one slot per gunicorn request thread so a matcher run never queues.
+_PREP_POOL = ThreadPoolExecutor(
+    max_workers=max(1, int(os.getenv("GUNICORN_THREADS") or 8)),
+    thread_name_prefix="chat-prep",
+)
 
 
 class TravelChatbot:
@@ -78,6 +95,7 @@ class TravelChatbot:
         }
         self.dataset_summary = self._build_dataset_summary()
         self.local_reference_terms = self._build_local_reference_terms()
+        self._local_reference_automaton = self._build_local_reference_automaton(self.local_reference_terms)
         self.matching_engine: Optional[FlexibleMatcherType] = self._init_matcher()
         self._recent_requests: Dict[str, Dict[str, Any]] = {}
 
@@ -102,8 +120,9 @@ class TravelChatbot:
 
     @staticmethod
     def _detect_language(text: str) -> str:
-        thai_chars = sum(1 for ch in text if "\u0e00" <= ch <= "\u0e7f")
-        return "th" if thai_chars > max(1, len(text) // 3) else "en"
+        if text.isascii():
+            return "en"
+        return "th" if len(THAI_CHAR_RE.findall(text)) > max(1, len(text) // 3) else "en"
 
     def _matcher_analysis(self, query: str) -> Dict[str, Any]:
         if not query.strip():
@@ -113,15 +132,22 @@ class TravelChatbot:
             return {"topic": None, "confidence": 0.0, "keywords": [], "is_local": False}
         topic = None
         confidence = 0.0
-        try:
-            topic, confidence = engine.find_best_match(query)
-        except Exception as exc:
-            print(f"[WARN] Flexible matcher topic detection failed: {exc}")
-        try:
-            is_local = engine.is_samutsongkhram_related(query)
-        except Exception as exc:
-            print(f"[WARN] Flexible matcher locality detection failed: {exc}")
-            is_local = False
+        is_local = False
+        if hasattr(engine, "classify"):
+            try:
+                topic, confidence, is_local = engine.classify(query)
+            except Exception as exc:
+                print(f"[WARN] Flexible matcher classification failed: {exc}")
+        else:
+            try:
+                topic, confidence = engine.find_best_match(query)
+            except Exception as exc:
+                print(f"[WARN] Flexible matcher topic detection failed: {exc}")
+            try:
+                is_local = engine.is_samutsongkhram_related(query)
+            except Exception as exc:
+                print(f"[WARN] Flexible matcher locality detection failed: {exc}")
+                is_local = False
         keywords: List[str] = []
         if topic:
             try:
@@ -159,7 +185,7 @@ class TravelChatbot:
 
     @staticmethod
     def _normalized_query_key(text: str) -> str:
-        collapsed = re.sub(r"\s+", " ", text.strip())
+        collapsed = WHITESPACE_RE.sub(" ", text.strip())
         return collapsed.lower()
 
     def _replay_duplicate_response(self, user_id: str, key: str) -> Optional[Dict[str, Any]]:
@@ -240,9 +266,7 @@ class TravelChatbot:
         try:
             db_gen = get_db()
             db = next(db_gen)
-            places = db.query(Place).all()
-            for place in places:
-                entries.append(place.to_dict())
+            entries = [place.to_dict() for place in db.query(Place).all()]
         except Exception as e:
             print(f"[ERROR] Failed to load data from DB: {e}")
             return []
@@ -291,7 +315,7 @@ class TravelChatbot:
     def _normalize_name_token(text: Optional[str]) -> str:
         if not text:
             return ""
-        normalized = re.sub(r"[^0-9a-zA-Z\u0E00-\u0E7F]+", "", text.strip().lower())
+        normalized = NON_WORD_RE.sub("", text.strip().lower())
         return normalized
 
 
@@ -404,7 +428,8 @@ class TravelChatbot:
         return normalized
 
     def _deduplicate_entries(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        merged: Dict[str, Dict[str, Any]] = {}
+        # Pick the highest-priority entry per id first; only the winners are copied.
+        winners: Dict[str, Tuple[int, Dict[str, Any]]] = {}
         for entry in entries:
             if not isinstance(entry, dict):
                 continue
@@ -412,25 +437,20 @@ class TravelChatbot:
             if not ident:
                 continue
             priority = entry.get("_priority", 0)
-            existing = merged.get(ident)
-            if existing and existing.get("_priority", 0) >= priority:
-                continue
-            normalized_entry = dict(entry)
-            normalized_entry["id"] = ident
-            normalized_entry["_priority"] = priority
-            merged[ident] = normalized_entry
+            current = winners.get(ident)
+            if current is None or priority > current[0]:
+                winners[ident] = (priority, entry)
 
-        final_entries: List[Dict[str, Any]] = []
-        for entry in merged.values():
-            entry.pop("_priority", None)
-            final_entries.append(entry)
-        return final_entries
+        return [
+            {**{key: value for key, value in entry.items() if key != "_priority"}, "id": ident}
+            for ident, (_, entry) in winners.items()
+        ]
 
 
     def _slugify_identifier(self, text: str) -> str:
         if not text:
             return hashlib.sha1(b"default").hexdigest()[:10]
-        cleaned = re.sub(r"[^0-9a-zA-Z\u0E00-\u0E7F]+", "-", text.strip().lower())
+        cleaned = NON_WORD_RE.sub("-", text.strip().lower())
         cleaned = cleaned.strip("-")
         if cleaned:
             return cleaned
@@ -459,7 +479,7 @@ class TravelChatbot:
         lines = []
         for entry in self.travel_data:
             name = entry.get("name") or entry.get("place_name") or "unknown"
-            city = entry.get("city") or entry.get("location", {}).get("district", "")
+            city = entry.get("city") or (entry.get("location") or _EMPTY).get("district", "")
             entry_type = entry.get("type") or entry.get("category", "")
             if isinstance(entry_type, list):
                 entry_type = ", ".join(str(t) for t in entry_type)
@@ -475,6 +495,18 @@ class TravelChatbot:
                     terms.add(value.lower())
         return list(terms)
 
+    @staticmethod
+    def _build_local_reference_automaton(terms: List[str]) -> Optional[Any]:
+        """Aho-Corasick automaton over the local terms (None when pyahocorasick is missing)."""
+        if ahocorasick is None or not terms:
+            return None
+        automaton = ahocorasick.Automaton()
+        for term in terms:
+            if term:
+                automaton.add_word(term, term)
+        automaton.make_automaton()
+        return automaton
+
     def _interpret_query_keywords(self, query: str) -> Dict[str, List[str]]:
         if not self.gpt_service or not self.dataset_summary:
             return {"keywords": [], "places": []}
@@ -601,11 +633,15 @@ class TravelChatbot:
 
     def _contains_local_reference(self, text: str) -> bool:
         lowered = text.lower()
+        automaton = self._local_reference_automaton
+        if automaton is not None:
+            # One pass over the text instead of a substring scan per term.
+            return next(automaton.iter(lowered), None) is not None
         return any(term in lowered for term in self.local_reference_terms)
 
     def _mentions_other_province(self, query: str, keyword_pool: List[str], places: List[str]) -> bool:
         normalized = query.lower()
-        province_match = re.search(r'จังหวัด\s*([^\s,.;!?]+)', normalized)
+        province_match = PROVINCE_RE.search(normalized)
         if province_match:
             name = province_match.group(1)
             if not self._contains_local_reference(name):
@@ -672,16 +708,14 @@ class TravelChatbot:
             )
 
         def summarize_entry(entry: Dict[str, Any], idx: int) -> str:
-            name = entry.get("name") or entry.get("place_name") or "Unknown"
-            location = entry.get("city") or entry.get("location", {}).get("district")
-            description = (
-                entry.get("description")
-                or entry.get("place_information", {}).get("detail")
-                or ""
-            )
-            highlights = entry.get("highlights") or entry.get("place_information", {}).get("highlights") or []
-            best_time = entry.get("best_time") or entry.get("place_information", {}).get("best_time")
-            tips = entry.get("tips") or entry.get("place_information", {}).get("tips")
+            get = entry.get
+            piget = (get("place_information") or _EMPTY).get
+            name = get("name") or get("place_name") or "Unknown"
+            location = get("city") or (get("location") or _EMPTY).get("district")
+            description = get("description") or piget("detail") or ""
+            highlights = get("highlights") or piget("highlights") or []
+            best_time = get("best_time") or piget("best_time")
+            tips = get("tips") or piget("tips")
 
             def join_highlights(items: Any) -> str:
                 if isinstance(items, list):
@@ -865,7 +899,12 @@ class TravelChatbot:
             }
         }
 
-    def get_response(self, user_message: str, user_id: str = "default") -> Dict[str, Any]:
+    def _prepare_response(self, user_message: str, user_id: str) -> Dict[str, Any]:
+        """Run the pipeline up to the GPT call.
+
+        Returns ``{"payload": ...}`` when the reply is already decided (duplicate replay,
+        greeting, out-of-scope or empty query); otherwise the inputs for the generation step.
+        """
         language = self._detect_language(user_message)
         self._refresh_settings()
         trimmed_query = user_message.strip()
@@ -873,7 +912,7 @@ class TravelChatbot:
         dedup_key = self._normalized_query_key(trimmed_query) if trimmed_query else ""
         cached_payload = self._replay_duplicate_response(user_id, dedup_key)
         if cached_payload:
-            return cached_payload
+            return {'payload': cached_payload}
 
         def finalize_response(payload: Dict[str, Any]) -> Dict[str, Any]:
             self._cache_response(user_id, dedup_key, payload)
@@ -892,7 +931,7 @@ class TravelChatbot:
                     "en",
                     "Hello! I'm Nong Pla Too, happy to help plan your Samut Songkhram adventures!"
                 )
-            return finalize_response({
+            return {'payload': finalize_response({
                 'response': greeting_text,
                 'structured_data': [],
                 'language': language,
@@ -906,10 +945,13 @@ class TravelChatbot:
                     'preference_note': self._preference_context(),
                     'character_note': self._character_context()
                 }
-            })
+            })}
 
+        # The interpretation is a network round trip and the matcher is local work; overlap them,
+        # keeping the blocking GPT call on the request thread.
+        matcher_future = _PREP_POOL.submit(self._matcher_analysis, user_message)
         analysis = self._interpret_query_keywords(user_message) if trimmed_query else {"keywords": [], "places": []}
-        matcher_signals = self._matcher_analysis(user_message)
+        matcher_signals = matcher_future.result()
         keyword_pool = self._merge_keywords(
             analysis.get("keywords") or [],
             analysis.get("places") or [],
@@ -990,7 +1032,7 @@ class TravelChatbot:
             warning_message = (
                 "น้องปลาทูจะให้ข้อมูลได้ชัดเจนและครอบคลุม หากถามข้อมูลในจังหวัดสมุทรสงครามค่ะ ขออภัยด้วยนะคะ"
             )
-            return finalize_response({
+            return {'payload': finalize_response({
                 'response': warning_message,
                 'structured_data': [],
                 'language': language,
@@ -1001,7 +1043,7 @@ class TravelChatbot:
                     'message': 'Out of supported province scope',
                     'data_available': False
                 }
-            })
+            })}
 
         if not user_message.strip():
             simple_msg = self._prompt(
@@ -1010,57 +1052,99 @@ class TravelChatbot:
                 default_th="กรุณาพิมพ์คำถามเกี่ยวกับการท่องเที่ยวในสมุทรสงครามนะคะ",
                 default_en="Please share a travel question for Samut Songkhram."
             )
-            return finalize_response({
+            return {'payload': finalize_response({
                 'response': simple_msg,
                 'structured_data': [],
                 'language': language,
                 'source': 'empty_query',
                 'data_status': data_status
-            })
+            })}
+
+        return {
+            'language': language,
+            'user_id': user_id,
+            'dedup_key': dedup_key,
+            'matched_data': matched_data,
+            'detected_intent': detected_intent,
+            'data_status': data_status,
+            'character_note': character_note,
+        }
+
+    def _gpt_payload(self, prepared: Dict[str, Any], gpt_result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'response': gpt_result['response'],
+            'structured_data': prepared['matched_data'],
+            'language': prepared['language'],
+            'source': gpt_result.get('source', 'openai'),
+            'intent': prepared['detected_intent'],
+            'tokens_used': gpt_result.get('tokens_used'),
+            'data_status': prepared['data_status'],
+            'character_note': prepared['character_note']
+        }
+
+    def _simple_payload(self, prepared: Dict[str, Any], source: str) -> Dict[str, Any]:
+        return {
+            'response': self._create_simple_response(prepared['matched_data'], prepared['language']),
+            'structured_data': prepared['matched_data'],
+            'language': prepared['language'],
+            'source': source,
+            'intent': prepared['detected_intent'],
+            'data_status': prepared['data_status']
+        }
+
+    def get_response(self, user_message: str, user_id: str = "default") -> Dict[str, Any]:
+        prepared = self._prepare_response(user_message, user_id)
+        if 'payload' in prepared:
+            return prepared['payload']
 
         if self.gpt_service:
             try:
                 gpt_result = self.gpt_service.generate_response(
                     user_query=user_message,
-                    context_data=matched_data,
+                    context_data=prepared['matched_data'],
                     data_type='travel',
-                    intent=detected_intent,
-                    data_status=data_status
+                    intent=prepared['detected_intent'],
+                    data_status=prepared['data_status']
                 )
-
-                return finalize_response({
-                    'response': gpt_result['response'],
-                    'structured_data': matched_data,
-                    'language': language,
-                    'source': gpt_result.get('source', 'openai'),
-                    'intent': detected_intent,
-                    'tokens_used': gpt_result.get('tokens_used'),
-                    'data_status': data_status,
-                    'character_note': character_note
-                })
-                
+                payload = self._gpt_payload(prepared, gpt_result)
             except Exception as e:
                 print(f"[ERROR] GPT generation failed: {e}")
-                simple_response = self._create_simple_response(matched_data, language)
-                return finalize_response({
-                    'response': simple_response,
-                    'structured_data': matched_data,
-                    'language': language,
-                    'source': 'simple_fallback',
-                    'intent': detected_intent,
-                    'gpt_error': str(e),
-                    'data_status': data_status
-                })
+                payload = self._simple_payload(prepared, 'simple_fallback')
+                payload['gpt_error'] = str(e)
         else:
-            simple_response = self._create_simple_response(matched_data, language)
-            return finalize_response({
-                'response': simple_response,
-                'structured_data': matched_data,
-                'language': language,
-                'source': 'simple',
-                'intent': detected_intent,
-                'data_status': data_status
-            })
+            payload = self._simple_payload(prepared, 'simple')
+        self._cache_response(user_id, prepared['dedup_key'], payload)
+        return payload
+
+    def stream_response(
+        self,
+        user_message: str,
+        user_id: str = "default",
+    ) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Streaming get_response: yields ``(delta, None)`` while GPT writes, then ``("", payload)``."""
+        prepared = self._prepare_response(user_message, user_id)
+        if 'payload' in prepared:
+            yield "", prepared['payload']
+            return
+
+        if not self.gpt_service:
+            payload = self._simple_payload(prepared, 'simple')
+        else:
+            gpt_result: Dict[str, Any] = {}
+            for delta, final in self.gpt_service.stream_response(
+                user_message,
+                prepared['matched_data'],
+                data_type='travel',
+                intent=prepared['detected_intent'],
+                data_status=prepared['data_status'],
+            ):
+                if final is None:
+                    yield delta, None
+                else:
+                    gpt_result = final
+            payload = self._gpt_payload(prepared, gpt_result)
+        self._cache_response(user_id, prepared['dedup_key'], payload)
+        yield "", payload
 
 
 _CHATBOT: Optional[TravelChatbot] = None
@@ -1075,27 +1159,25 @@ def chat_with_bot(message: str, user_id: str = "default") -> str:
     return result['response']
 
 
-def get_chat_response(message: str, user_id: str = "default") -> Dict[str, Any]:
+def _get_chatbot() -> TravelChatbot:
     global _CHATBOT
     if _CHATBOT is None:
         _CHATBOT = TravelChatbot()
-    language = _CHATBOT._detect_language(message)
+    return _CHATBOT
 
-    # Detect DB connectivity (adaptive branch)
-    db_connected = False
-    if DB_SERVICE_AVAILABLE:
-        try:
-            svc = get_db_service()
-            db_connected = svc.test_connection()
-        except Exception as exc:
-            print(f"[WARN] DB connectivity check failed: {exc}")
-            db_connected = False
 
-    if not db_connected:
-        result = _CHATBOT._pure_gpt_response(message, language)
-    else:
-        result = _CHATBOT.get_response(message, user_id)
+def _db_connected() -> bool:
+    """Detect DB connectivity (adaptive branch)."""
+    if not DB_SERVICE_AVAILABLE:
+        return False
+    try:
+        return get_db_service().test_connection()
+    except Exception as exc:
+        print(f"[WARN] DB connectivity check failed: {exc}")
+        return False
 
+
+def _annotate_result(result: Dict[str, Any], db_connected: bool) -> Dict[str, Any]:
     # Attach model + character info uniformly
     try:
         model_params = PROMPT_REPO.get_model_params()
@@ -1116,6 +1198,30 @@ def get_chat_response(message: str, user_id: str = "default") -> Dict[str, Any]:
     return result
 
 
+def get_chat_response(message: str, user_id: str = "default") -> Dict[str, Any]:
+    bot = _get_chatbot()
+    db_connected = _db_connected()
+    if not db_connected:
+        result = bot._pure_gpt_response(message, bot._detect_language(message))
+    else:
+        result = bot.get_response(message, user_id)
+    return _annotate_result(result, db_connected)
+
+
+def stream_chat_response(message: str, user_id: str = "default") -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Streaming get_chat_response: ``(delta, None)`` chunks, then ``("", result)``."""
+    bot = _get_chatbot()
+    db_connected = _db_connected()
+    if not db_connected:
+        yield "", _annotate_result(bot._pure_gpt_response(message, bot._detect_language(message)), db_connected)
+        return
+    for delta, result in bot.stream_response(message, user_id):
+        if result is None:
+            yield delta, None
+        else:
+            yield "", _annotate_result(result, db_connected)
+
+
 if __name__ == "__main__":
     print("NongPlaToo GPT Travel Assistant ready. Type 'quit' to exit.")
     bot = TravelChatbot()
@@ -2,52 +2,526 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
+import logging
 import os
-from typing import Any, Dict, List, Optional
+import random
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import cached_property, lru_cache
+from io import StringIO
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
 
-from openai import OpenAI
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+try:
+    from prometheus_client import Counter, Histogram
+except ImportError:  # pragma: no cover - optional dependency
+    Counter = Histogram = None
 
 from world_journey_ai.configs import PromptRepo
+from world_journey_ai.utils import EMPTY as _EMPTY, THAI_CHAR_RE, json_loads as _json_loads, orjson
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI
 
 PROMPT_REPO = PromptRepo()
+log = logging.getLogger("gpt_service")
+METRICS_LOG = logging.getLogger("gpt_service.metrics")
+if Counter is not None and Histogram is not None:
+    OPENAI_REQUESTS = Counter("openai_requests_total", "OpenAI chat completion calls", ["status"])
+    OPENAI_LATENCY = Histogram("openai_latency_seconds", "OpenAI chat completion latency")
+else:
+    OPENAI_REQUESTS = OPENAI_LATENCY = None
+# Context limits: places per prompt, per-field character caps, and rendered-context LRU size.
+CONTEXT_MAX_ITEMS = 5
+CONTEXT_DETAIL_MAX = 400
+CONTEXT_HOURS_MAX = 80
+CONTEXT_CACHE_SIZE = 512
+# Keyword-extraction results kept per process (entries expire after entities.cache_ttl seconds).
+ENTITY_CACHE_SIZE = 256
+# Sentence boundary for TTS hand-off: terminal punctuation followed by space, or Thai polite particles.
+SENTENCE_END_RE = re.compile(r"[.!?。]\s|ค่ะ|ครับ")
+DEFAULT_GREETING_PROMPT = "Provide a short greeting suitable for a Samut Songkhram travel assistant."
+DEFAULT_FALLBACK_TH = "ขออภัยค่ะ ขณะนี้ระบบ AI ไม่พร้อมให้บริการ\n\nกรุณาลองใหม่อีกครั้งในภายหลัง และนี่คือคำถามของคุณ: {query}"
+DEFAULT_FALLBACK_EN = (
+    "Sorry, the AI system is currently unavailable.\n\n"
+    "Please try again later. Here is your question for reference: {query}"
+)
+
+
+def _clip(value: Any, limit: int) -> Any:
+    """Truncate long text fields so a single verbose description can't dominate the prompt."""
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit].rstrip() + "…"
+    return value
+
+
+def _line(label: str, value: Any) -> str:
+    """One context line ("\\n<label>: <value>"), or "" when the field is empty."""
+    return f"\n{label}: {value}" if value else ""
+
+
+def _listed(value: Any, sep: str) -> Any:
+    """First three entries of a list field joined with ``sep``; scalars pass through."""
+    if value and isinstance(value, list):
+        return sep.join(map(str, value[:3]))
+    return value
+
+
+def _digest(obj: Any) -> bytes:
+    """Stable 16-byte blake2b digest of a JSON-like value (key order independent)."""
+    payload = None
+    if orjson is not None:
+        try:
+            payload = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS, default=str)
+        except TypeError:
+            payload = None
+    if payload is None:
+        payload = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+@lru_cache(maxsize=None)
+def _prompt_settings() -> Dict[str, Any]:
+    """Resolve prompts and model parameters once per process for every GPTService."""
+    system_data = PROMPT_REPO.get_prompt("chatbot/system", default={})
+    answer_prompts = PROMPT_REPO.get_prompt("chatbot/answer", default={})
+    fallback_prompts = answer_prompts.get("fallback", {})
+    return {
+        "model_config": PROMPT_REPO.get_model_params(),
+        "system_prompts": system_data.get("default", {}),
+        "character_profile": PROMPT_REPO.get_character_profile(),
+        "answer_prompts": answer_prompts,
+        "fallback_templates": {
+            "th": fallback_prompts.get("th", DEFAULT_FALLBACK_TH),
+            "en": fallback_prompts.get("en", DEFAULT_FALLBACK_EN),
+        },
+        "search_prompts": PROMPT_REPO.get_prompt("chatbot/search", default={}),
+        "preferences": PROMPT_REPO.get_preferences(),
+        "greeting_prompt": PROMPT_REPO.get_prompt(
+            "chatbot/answer/greeting_prompt",
+            default=DEFAULT_GREETING_PROMPT,
+        ),
+    }
+
+
+@lru_cache(maxsize=None)
+def _env_settings() -> Dict[str, Optional[str]]:
+    """OPENAI_* environment overrides, read once per process (reset by GPTService.reload_prompts)."""
+    return {
+        name: os.getenv(name)
+        for name in ("OPENAI_API_KEY", "OPENAI_MODEL", "OPENAI_RPS", "OPENAI_TPM", "OPENAI_WARMUP")
+    }
+
+
+@lru_cache(maxsize=None)
+def _retryable_errors() -> Tuple[Type[BaseException], ...]:
+    """Transient OpenAI failures worth another attempt; anything else (e.g. BadRequestError) falls back at once."""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    return (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def _retry_policy() -> Tuple[int, float, float]:
+    """(attempts, initial_delay, max_delay) from the models.json ``retry`` section."""
+    retry_params = _prompt_settings()["model_config"].get("retry", {})
+    return (
+        max(1, int(retry_params.get("attempts", 3))),
+        retry_params.get("initial_delay", 0.5),
+        retry_params.get("max_delay", 8.0),
+    )
+
+
+def _backoff_delay(attempt: int, exc: BaseException, initial_delay: float, max_delay: float) -> float:
+    """Honour Retry-After when the API sends one, else exponential backoff with jitter."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000.0, max_delay)
+        if headers.get("retry-after"):
+            return min(float(headers["retry-after"]), max_delay)
+    except ValueError:
+        pass
+    backoff = initial_delay * (2 ** (attempt - 1))
+    return min(backoff + random.uniform(0, initial_delay), max_delay)
+
+
+_T = TypeVar("_T")
+RetryPolicy = Tuple[int, float, float]
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """True for the transient OpenAI failures call_with_retries already retries."""
+    return isinstance(exc, _retryable_errors())
+
+
+def _next_retry_delay(attempt: int, exc: BaseException, policy: RetryPolicy) -> Optional[float]:
+    """Backoff before retrying after failed ``attempt``, or None once the budget is spent."""
+    attempts, initial_delay, max_delay = policy
+    if attempt >= attempts:
+        return None
+    delay = _backoff_delay(attempt, exc, initial_delay, max_delay)
+    log.warning(
+        "OpenAI call failed (%s); retry %d/%d in %.2fs",
+        type(exc).__name__,
+        attempt,
+        attempts - 1,
+        delay,
+    )
+    return delay
+
+
+def call_with_retries(call: Callable[[], _T], policy: Optional[RetryPolicy] = None) -> _T:
+    """Run ``call``, retrying transient OpenAI errors (see _retryable_errors).
+
+    ``policy`` is ``(attempts, initial_delay, max_delay)``; by default the models.json
+    ``retry`` section, so callers outside GPTService (e.g. the chatbot engines) share it.
+    """
+    retryable = _retryable_errors()
+    policy = policy or _retry_policy()
+    attempt = 1
+    while True:
+        try:
+            return call()
+        except retryable as exc:
+            delay = _next_retry_delay(attempt, exc, policy)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_retries(call: Callable[[], Awaitable[_T]], policy: Optional[RetryPolicy] = None) -> _T:
+    """Async twin of call_with_retries: awaits ``call()`` and sleeps without blocking the loop."""
+    retryable = _retryable_errors()
+    policy = policy or _retry_policy()
+    attempt = 1
+    while True:
+        try:
+            return await call()
+        except retryable as exc:
+            delay = _next_retry_delay(attempt, exc, policy)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def _max_tokens_fallback(kwargs: Dict[str, Any], exc: TypeError) -> Optional[Dict[str, Any]]:
+    """kwargs with ``max_tokens`` instead of ``max_completion_tokens`` when an older SDK rejected the latter."""
+    if "max_completion_tokens" not in str(exc) or "max_completion_tokens" not in kwargs:
+        return None
+    fallback_kwargs = dict(kwargs)
+    fallback_kwargs["max_tokens"] = fallback_kwargs.pop("max_completion_tokens")
+    return fallback_kwargs
+
+
+def _http_client_kwargs(http_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate the ``http`` section of models.json into httpx client kwargs."""
+    import httpx
+
+    http2 = bool(http_params.get("http2", True))
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        except ImportError:
+            http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_keepalive_connections=http_params.get("max_keepalive_connections", 100),
+            max_connections=http_params.get("max_connections", 200),
+            keepalive_expiry=http_params.get("keepalive_expiry", 60.0),
+        ),
+        "timeout": httpx.Timeout(
+            connect=http_params.get("connect_timeout", 5.0),
+            read=http_params.get("read_timeout", 60.0),
+            write=http_params.get("write_timeout", 10.0),
+            pool=http_params.get("pool_timeout", 1.0),
+        ),
+    }
+
+
+_OPENAI_CLIENTS: Dict[str, "OpenAI"] = {}
+_OPENAI_CLIENTS_LOCK = threading.Lock()
+# AsyncOpenAI clients per event loop, then per API key: httpx async transports are bound to the
+# loop they were opened on, so each long-lived loop keeps its own pool. Entries go with the loop.
+_ASYNC_OPENAI_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+# (api_key, model) pairs already warmed in this process; one probe per worker is enough.
+_WARMED_MODELS: set = set()
+# Rendered context blocks keyed by (model, data_type, token_budget, content digest of the places),
+# shared by every GPTService so popular place lists are formatted and token-trimmed once per process.
+_CONTEXT_CACHE: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+_CONTEXT_CACHE_LOCK = threading.Lock()
+# Pre-generated greeting variants per (language, model) -> (created_at, variants), shared by every GPTService.
+_GREETING_CACHE: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+_GREETING_CACHE_LOCK = threading.Lock()
+# extract_query_entities results keyed by (model, normalized query, dataset digest) -> (created_at, result).
+_ENTITY_CACHE: "OrderedDict[Tuple[Any, ...], Tuple[float, Dict[str, List[str]]]]" = OrderedDict()
+_ENTITY_CACHE_LOCK = threading.Lock()
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    """One pooled OpenAI client per API key, shared by every GPTService in the process."""
+    with _OPENAI_CLIENTS_LOCK:
+        client = _OPENAI_CLIENTS.get(api_key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            http_params = _prompt_settings()["model_config"].get("http", {})
+            # Retries are handled in GPTService._call_with_retries; keep the SDK from stacking its own.
+            client = _OPENAI_CLIENTS[api_key] = OpenAI(
+                api_key=api_key,
+                http_client=httpx.Client(**_http_client_kwargs(http_params)),
+                max_retries=0,
+            )
+        return client
+
+
+def get_async_openai_client(api_key: str) -> Any:
+    """One pooled AsyncOpenAI client per API key for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _OPENAI_CLIENTS_LOCK:
+        clients = _ASYNC_OPENAI_CLIENTS.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_params = _prompt_settings()["model_config"].get("http", {})
+            client = clients[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                http_client=httpx.AsyncClient(**_http_client_kwargs(http_params)),
+                max_retries=0,
+            )
+        return client
+
+
+def close_openai_clients() -> None:
+    """Close the shared OpenAI connection pools, sync and async (e.g. at worker shutdown)."""
+    with _OPENAI_CLIENTS_LOCK:
+        clients = list(_OPENAI_CLIENTS.values())
+        _OPENAI_CLIENTS.clear()
+        async_clients = [(loop, list(by_key.values())) for loop, by_key in _ASYNC_OPENAI_CLIENTS.items()]
+        _ASYNC_OPENAI_CLIENTS.clear()
+    for client in clients:
+        client.close()
+    for loop, loop_clients in async_clients:
+        # A closed loop already dropped its transports; a loop still running in another
+        # thread closes its clients itself, an idle one is driven here.
+        if loop.is_closed():
+            continue
+        for client in loop_clients:
+            try:
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(client.close(), loop)
+                else:
+                    loop.run_until_complete(client.close())
+            except Exception as exc:
+                log.warning("Could not close async OpenAI client: %s", exc)
+
+
+class FirstTokenTimeout(TimeoutError):
+    """A streamed completion produced no tokens within ``first_token_timeout``."""
+
+
+@lru_cache(maxsize=None)
+def _timeout_errors() -> Tuple[Type[BaseException], ...]:
+    import httpx
+    from openai import APITimeoutError
+
+    return (httpx.TimeoutException, APITimeoutError)
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace OpenAI calls below the account quota."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until ``tokens`` are available, then consume them."""
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
 
 
 class GPTService:
-    """Generate travel guidance using OpenAI and optional local datasets."""
+    """Generate travel guidance using OpenAI and optional local datasets.
+
+    The OpenAI client is shared process-wide per API key and runs on a keep-alive
+    ``httpx`` pool (HTTP/2 when ``h2`` is installed), so every service instance
+    reuses warm TLS connections instead of paying a handshake each time.  Idle
+    sockets stay open for ``keepalive_expiry`` seconds; call
+    :func:`close_openai_clients` at shutdown to release them early.
+    """
 
-    def __init__(self) -> None:
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.model_config = PROMPT_REPO.get_model_params()
+    @classmethod
+    def reload_prompts(cls) -> None:
+        """Drop the per-process prompt/model snapshot so new instances re-read the config files."""
+        global PROMPT_REPO
+        PromptRepo._load_json.cache_clear()
+        PromptRepo._load_prompt_namespace.cache_clear()
+        PROMPT_REPO = PromptRepo()
+        _prompt_settings.cache_clear()
+        _env_settings.cache_clear()
+
+    def __init__(self, *, rps: Optional[float] = None, tpm: Optional[int] = None) -> None:
+        env = _env_settings()
+        self.api_key = env["OPENAI_API_KEY"]
+        settings = _prompt_settings()
+        self.model_config = settings["model_config"]
         chat_params = self.model_config.get("chat", {})
         greeting_params = self.model_config.get("greeting", {})
-        self.model_name = os.getenv("OPENAI_MODEL") or self.model_config.get("default_model")
-        system_data = PROMPT_REPO.get_prompt("chatbot/system", default={})
-        self.system_prompts = system_data.get("default", {})
-        self.character_profile = PROMPT_REPO.get_character_profile()
-        self.answer_prompts = PROMPT_REPO.get_prompt("chatbot/answer", default={})
-        self.search_prompts = PROMPT_REPO.get_prompt("chatbot/search", default={})
-        self.preferences = PROMPT_REPO.get_preferences()
+        entity_params = self.model_config.get("entities", {})
+        rate_params = self.model_config.get("rate_limit", {})
+        self.model_name = env["OPENAI_MODEL"] or self.model_config.get("default_model")
+        self.system_prompts = settings["system_prompts"]
+        th_prompt = self.system_prompts.get("th", "")
+        self._system_prompt_cache = {"th": th_prompt, "en": self.system_prompts.get("en", th_prompt)}
+        self.character_profile = settings["character_profile"]
+        self.answer_prompts = settings["answer_prompts"]
+        self._fallback_templates = settings["fallback_templates"]
+        self.search_prompts = settings["search_prompts"]
+        self.preferences = settings["preferences"]
+        self.greeting_prompt = settings["greeting_prompt"]
         self.temperature = chat_params.get("temperature", 0.7)
         self.max_completion_tokens = chat_params.get("max_completion_tokens", 800)
         self.top_p = chat_params.get("top_p", 1.0)
-        self.presence_penalty = chat_params.get("presence_penalty", 0.1)
-        self.frequency_penalty = chat_params.get("frequency_penalty", 0.1)
+        self.presence_penalty = chat_params.get("presence_penalty", 0.0)
+        self.frequency_penalty = chat_params.get("frequency_penalty", 0.0)
+        # Sampling kwargs shared by every answer request, built once; each call only adds
+        # messages and its token cap. Penalties are only sent when configured (zero is the
+        # API default anyway).
+        self._chat_base_kwargs: Dict[str, Any] = {
+            "model": self.model_name,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            **{
+                name: value
+                for name, value in (("presence_penalty", self.presence_penalty), ("frequency_penalty", self.frequency_penalty))
+                if value
+            },
+        }
+        # Output cap per detected intent; intents not listed get max_completion_tokens.
+        self.max_tokens_by_intent: Dict[str, int] = dict(chat_params.get("max_completion_tokens_by_intent", {}))
+        self.context_token_budget = chat_params.get("context_token_budget", 2048)
+        self.context_window = chat_params.get("context_window", 128000)
+        # Streaming watchdog: give up if prefill stalls, and cap total generation time.
+        self.first_token_timeout = chat_params.get("first_token_timeout", 15.0)
+        self.generation_timeout = chat_params.get("generation_timeout", 90.0)
         self.greeting_temperature = greeting_params.get("temperature", 0.8)
         self.greeting_max_tokens = greeting_params.get("max_completion_tokens", 150)
         self.greeting_top_p = greeting_params.get("top_p", 1.0)
+        self.greeting_cache_ttl = greeting_params.get("cache_ttl", 3600)
+        self.greeting_pool_size = max(1, int(greeting_params.get("pool_size", 10)))
+        self.entity_cache_ttl = entity_params.get("cache_ttl", 900)
+        self.retry_attempts, self.retry_initial_delay, self.retry_max_delay = _retry_policy()
+        self._encoding = self._load_encoding()
+        # Static system prefix built once: every request starts with the identical message
+        # (OpenAI's automatic prompt cache matches on exact leading tokens), and its token
+        # count is known up front.
+        self._system_messages = {
+            lang: {"role": "system", "content": prompt} for lang, prompt in self._system_prompt_cache.items()
+        }
+        self._system_tokens = {lang: self._count_tokens(prompt) for lang, prompt in self._system_prompt_cache.items()}
+
+        # Client-side pacing: requests/second always, tokens/minute when a quota is configured.
+        if rps is None:
+            rps = float(env["OPENAI_RPS"] or rate_params.get("rps", 10))
+        if tpm is None:
+            tpm = int(env["OPENAI_TPM"] or rate_params.get("tpm", 0))
+        self.rps, self.tpm = rps, tpm
+        self._rps_bucket = TokenBucket(rate=rps, capacity=rate_params.get("burst", 20)) if rps > 0 else None
+        self._tpm_bucket = TokenBucket(rate=tpm / 60.0, capacity=tpm) if tpm > 0 else None
+        # Singleflight: identical in-flight requests wait on the first caller's result.
+        self._inflight: Dict[bytes, Future] = {}
+        self._inflight_lock = threading.Lock()
+        # prompt_cache_key per system prompt, so requests sharing a prefix hit the server KV cache.
+        self._cache_keys: Dict[Tuple[str, str], str] = {}
 
         if not self.api_key:
-            print("[WARN] OPENAI_API_KEY not found")
-            self.client: Optional[OpenAI] = None
-            return
+            log.warning("OPENAI_API_KEY not found")
+        elif self.model_config.get("warmup", True) and env["OPENAI_WARMUP"] != "0":
+            self._start_warmup()
 
+    @cached_property
+    def client(self) -> Optional[OpenAI]:
+        """Shared OpenAI client, built on first use so the SDK import is skipped when GPT is never called."""
+        if not self.api_key:
+            return None
         try:
-            self.client = OpenAI(api_key=self.api_key)
-            print(f"[OK] OpenAI client init (model: {self.model_name})")
+            client = get_openai_client(self.api_key)
         except Exception as exc:
-            print(f"[ERROR] OpenAI client init failed: {exc}")
-            self.client = None
+            log.error("OpenAI client init failed: %s", exc)
+            return None
+        log.info("OpenAI client ready (model: %s)", self.model_name)
+        return client
+
+    @cached_property
+    def _stream_timeout(self) -> Any:
+        """Per-request httpx timeout for streams: pooled defaults, read capped at first_token_timeout."""
+        import httpx
+
+        http_params = self.model_config.get("http", {})
+        return httpx.Timeout(
+            connect=http_params.get("connect_timeout", 5.0),
+            read=self.first_token_timeout,
+            write=http_params.get("write_timeout", 10.0),
+            pool=http_params.get("pool_timeout", 1.0),
+        )
+
+    def _start_warmup(self) -> None:
+        """Warm TLS, the model and the system-prompt cache once per process, off the request path."""
+        warm_id = (self.api_key, self.model_name)
+        with _OPENAI_CLIENTS_LOCK:
+            if warm_id in _WARMED_MODELS:
+                return
+            _WARMED_MODELS.add(warm_id)
+        threading.Thread(target=self._warmup, name="gpt-warmup", daemon=True).start()
+
+    def _warmup(self) -> None:
+        if not self.client:
+            return
+        try:
+            self._create_chat_completion(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": self._system_prompt("th")},
+                    {"role": "user", "content": "ok"},
+                ],
+                max_completion_tokens=1,
+                temperature=0,
+            )
+        except Exception as exc:
+            log.warning("OpenAI warmup failed: %s", exc)
 
     # ------------------------------------------------------------------
     # Public API
@@ -70,55 +544,318 @@ class GPTService:
             return self._build_fallback_payload(language, user_query, context_data, "no_openai_client")
 
         try:
-            data_context = self._format_context_data(context_data, data_type)
-            status_note = self._build_context_status_note(data_status, bool(context_data))
-            preference_note = self._build_preference_note()
-            search_instruction = self._build_search_instruction(language)
-            guardrail_note = self._context_guardrail(language, len(context_data))
-
-            user_parts = [f"User Query: {user_query}"]
-            if intent:
-                user_parts.append(f"Detected Intent: {intent}")
-            if status_note:
-                user_parts.append(status_note)
-            if preference_note:
-                user_parts.append(preference_note)
-            if search_instruction:
-                user_parts.append(search_instruction)
-            if guardrail_note:
-                user_parts.append(guardrail_note)
-            user_parts.append(data_context)
-            user_message = "\n\n".join(part for part in user_parts if part)
+            request = self._build_chat_request(
+                language,
+                user_query,
+                context_data,
+                data_type=data_type,
+                intent=intent,
+                data_status=data_status,
+                system_override=system_override,
+            )
+            response = self._create_chat_completion(**request)
+            retry_request = self._length_retry_request(request, response)
+            if retry_request is not None:
+                response = self._create_chat_completion(**retry_request)
 
-            response = self._create_chat_completion(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_override or self._system_prompt(language)},
-                    {"role": "user", "content": user_message},
-                ],
-                temperature=self.temperature,
-                top_p=self.top_p,
-                max_completion_tokens=self.max_completion_tokens,
-                presence_penalty=self.presence_penalty,
-                frequency_penalty=self.frequency_penalty,
+            return self._build_response_payload(language, user_query, context_data, response)
+        except Exception as exc:
+            log.error("GPT generation failed: %s", exc)
+            payload = self._build_fallback_payload(language, user_query, context_data, "fallback_error")
+            payload["error"] = str(exc)
+            return payload
+
+    async def agenerate_response(
+        self,
+        user_query: str,
+        context_data: List[Dict[str, Any]],
+        *,
+        data_type: str = "attractions",
+        intent: Optional[str] = None,
+        data_status: Optional[Dict[str, Any]] = None,
+        system_override: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Awaitable generate_response on AsyncOpenAI, for callers already running an event loop."""
+        item = {
+            "user_query": user_query,
+            "context_data": context_data,
+            "data_type": data_type,
+            "intent": intent,
+            "data_status": data_status,
+            "system_override": system_override,
+        }
+        if not self.api_key:
+            return self._batch_fallback(item, "no_openai_client")
+        try:
+            aclient = self._async_openai()
+        except ImportError as exc:
+            log.error("Async OpenAI client unavailable: %s", exc)
+            return self._batch_fallback(item, "no_openai_client")
+        return await self._agenerate_one(aclient, item)
+
+    async def agenerate_many(
+        self,
+        queries: List[Dict[str, Any]],
+        *,
+        max_concurrency: int = 8,
+    ) -> List[Dict[str, Any]]:
+        """Run many generate_response calls concurrently on AsyncOpenAI.
+
+        Each item holds generate_response arguments (``user_query``, ``context_data`` and the
+        optional keyword arguments). Payloads are returned in input order.
+        """
+        if not queries:
+            return []
+        if not self.api_key:
+            return [self._batch_fallback(item, "no_openai_client") for item in queries]
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        try:
+            aclient = self._async_openai()
+        except ImportError as exc:
+            log.error("Async OpenAI client unavailable: %s", exc)
+            return [self._batch_fallback(item, "no_openai_client") for item in queries]
+
+        async def run(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._agenerate_one(aclient, item)
+
+        results = await asyncio.gather(*(run(item) for item in queries), return_exceptions=True)
+
+        payloads = []
+        for item, result in zip(queries, results):
+            if isinstance(result, BaseException):
+                payload = self._batch_fallback(item, "fallback_error")
+                payload["error"] = str(result)
+                payloads.append(payload)
+            else:
+                payloads.append(result)
+        return payloads
+
+    async def stream_sentences(
+        self,
+        user_query: str,
+        context_data: List[Dict[str, Any]],
+        *,
+        data_type: str = "attractions",
+        intent: Optional[str] = None,
+        data_status: Optional[Dict[str, Any]] = None,
+        system_override: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream the response one sentence at a time, e.g. to feed a TTS engine."""
+        language = self._detect_language(user_query)
+        if not self.api_key:
+            yield self._create_fallback_response(language, user_query)
+            return
+
+        emitted = False
+        buf = ""
+        try:
+            request = self._build_chat_request(
+                language,
+                user_query,
+                context_data,
+                data_type=data_type,
+                intent=intent,
+                data_status=data_status,
+                system_override=system_override,
+            )
+            aclient = self._async_openai()
+            stream = await self._acreate_chat_completion(
+                aclient,
+                stream=True,
+                stream_options={"include_usage": True},
+                **request,
             )
+            async for chunk in stream:
+                choices = getattr(chunk, "choices", None)
+                delta = getattr(choices[0].delta, "content", None) if choices else None
+                if not delta:
+                    continue
+                buf += delta
+                match = SENTENCE_END_RE.search(buf)
+                while match:
+                    sentence, buf = buf[:match.end()].strip(), buf[match.end():]
+                    if sentence:
+                        emitted = True
+                        yield sentence
+                    match = SENTENCE_END_RE.search(buf)
+        except Exception as exc:
+            log.error("GPT sentence streaming failed: %s", exc)
+            if not emitted:
+                yield self._create_fallback_response(language, user_query)
+            return
+
+        tail = buf.strip()
+        if tail:
+            yield tail
+        elif not emitted:
+            yield self._create_fallback_response(language, user_query)
 
-            ai_response = self._safe_extract_content(response) or self._create_fallback_response(language, user_query)
+    def _async_openai(self) -> Any:
+        """The running event loop's pooled AsyncOpenAI client (see get_async_openai_client)."""
+        return get_async_openai_client(self.api_key)
 
-            return {
-                "response": ai_response,
-                "data": context_data,
-                "language": language,
-                "source": self.model_name,
-                "model": self.model_name,
-                "tokens_used": getattr(response.usage, "total_tokens", None) if hasattr(response, "usage") else None,
-            }
+    async def _agenerate_one(self, aclient: Any, item: Dict[str, Any]) -> Dict[str, Any]:
+        user_query = item.get("user_query", "")
+        context_data = item.get("context_data") or []
+        language = self._detect_language(user_query)
+        try:
+            request = self._build_chat_request(
+                language,
+                user_query,
+                context_data,
+                data_type=item.get("data_type", "attractions"),
+                intent=item.get("intent"),
+                data_status=item.get("data_status"),
+                system_override=item.get("system_override"),
+            )
+            response = await self._acreate_chat_completion(aclient, **request)
+            retry_request = self._length_retry_request(request, response)
+            if retry_request is not None:
+                response = await self._acreate_chat_completion(aclient, **retry_request)
+            return self._build_response_payload(language, user_query, context_data, response)
         except Exception as exc:
-            print(f"[ERROR] GPT generation failed: {exc}")
+            log.error("GPT generation failed: %s", exc)
             payload = self._build_fallback_payload(language, user_query, context_data, "fallback_error")
             payload["error"] = str(exc)
             return payload
 
+    def _batch_fallback(self, item: Dict[str, Any], source: str) -> Dict[str, Any]:
+        user_query = item.get("user_query", "")
+        language = self._detect_language(user_query)
+        return self._build_fallback_payload(language, user_query, item.get("context_data") or [], source)
+
+    def stream_response(
+        self,
+        user_query: str,
+        context_data: List[Dict[str, Any]],
+        *,
+        data_type: str = "attractions",
+        intent: Optional[str] = None,
+        data_status: Optional[Dict[str, Any]] = None,
+        system_override: Optional[str] = None,
+    ) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Stream a travel response as ``(delta_text, None)`` tuples, ending with ``("", payload)``."""
+        language = self._detect_language(user_query)
+
+        if not self.client:
+            yield "", self._build_fallback_payload(language, user_query, context_data, "no_openai_client")
+            return
+
+        parts: List[str] = []
+        usage_sink: Dict[str, Any] = {}
+        try:
+            request = self._build_chat_request(
+                language,
+                user_query,
+                context_data,
+                data_type=data_type,
+                intent=intent,
+                data_status=data_status,
+                system_override=system_override,
+            )
+            for delta in self._stream_chat_completion(usage_sink, **request):
+                parts.append(delta)
+                yield delta, None
+        except FirstTokenTimeout as exc:
+            log.warning("%s", exc)
+            yield "", self._build_fallback_payload(language, user_query, context_data, "first_token_timeout")
+            return
+        except Exception as exc:
+            log.error("GPT streaming failed: %s", exc)
+            payload = self._build_fallback_payload(language, user_query, context_data, "fallback_error")
+            payload["error"] = str(exc)
+            yield "", payload
+            return
+
+        ai_response = "".join(parts).strip() or self._create_fallback_response(language, user_query)
+        yield "", {
+            "response": ai_response,
+            "data": context_data,
+            "language": language,
+            "source": self.model_name,
+            "model": self.model_name,
+            "tokens_used": getattr(usage_sink.get("usage"), "total_tokens", None),
+        }
+
+    def _build_chat_request(
+        self,
+        language: str,
+        user_query: str,
+        context_data: List[Dict[str, Any]],
+        *,
+        data_type: str,
+        intent: Optional[str],
+        data_status: Optional[Dict[str, Any]],
+        system_override: Optional[str],
+    ) -> Dict[str, Any]:
+        """Assemble the chat.completions kwargs shared by the blocking and streaming paths."""
+        if system_override:
+            system_message = {"role": "system", "content": system_override}
+            system_tokens = self._count_tokens(system_override)
+        else:
+            lang = "th" if language == "th" else "en"
+            system_message, system_tokens = self._system_messages[lang], self._system_tokens[lang]
+        completion_cap = self.max_tokens_by_intent.get(intent or "", self.max_completion_tokens)
+
+        status_note = self._build_context_status_note(data_status, bool(context_data))
+        preference_note = self._build_preference_note()
+        search_instruction = self._build_search_instruction(language)
+        guardrail_note = self._context_guardrail(language, len(context_data))
+
+        buf = StringIO()
+        w = buf.write
+        w("User Query: ")
+        w(user_query)
+        if intent:
+            w("\n\nDetected Intent: ")
+            w(intent)
+        for note in (status_note, preference_note, search_instruction, guardrail_note):
+            if note:
+                w("\n\n")
+                w(note)
+        prompt_tokens = system_tokens + self._count_tokens(buf.getvalue())
+
+        # Places get whatever the window leaves after the system prompt, the query/notes and
+        # the completion cap, up to context_token_budget.
+        context_budget = max(
+            1,
+            min(self.context_token_budget, self.context_window - prompt_tokens - completion_cap - 128),
+        )
+        data_context = self._format_context_data(context_data, data_type, token_budget=context_budget)
+        w("\n\n")
+        w(data_context)
+        user_message = buf.getvalue()
+        prompt_tokens += self._count_tokens(data_context)
+        max_completion_tokens = max(1, min(completion_cap, self.context_window - prompt_tokens - 128))
+
+        return {
+            **self._chat_base_kwargs,
+            "messages": [system_message, {"role": "user", "content": user_message}],
+            "max_completion_tokens": max_completion_tokens,
+        }
+
+    def _build_response_payload(
+        self,
+        language: str,
+        user_query: str,
+        context_data: List[Dict[str, Any]],
+        response: Any,
+    ) -> Dict[str, Any]:
+        ai_response = self._safe_extract_content(response)
+        if ai_response and self._stopped_at_length(response):
+            ai_response = self._trim_to_sentence(ai_response)
+        ai_response = ai_response or self._create_fallback_response(language, user_query)
+        return {
+            "response": ai_response,
+            "data": context_data,
+            "language": language,
+            "source": self.model_name,
+            "model": self.model_name,
+            "tokens_used": getattr(response.usage, "total_tokens", None) if hasattr(response, "usage") else None,
+        }
+
     def generate_greeting(self, language: str = "th") -> str:
         if not self.client:
             if language == "th":
@@ -126,141 +863,404 @@ class GPTService:
             return "Hello! I'm NongPlaToo, ready to help you plan your Samut Songkhram trip!"
 
         try:
-            response = self._create_chat_completion(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": self._system_prompt(language)},
-                    {
-                        "role": "user",
-                        "content": PROMPT_REPO.get_prompt(
-                            "chatbot/answer/greeting_prompt",
-                            default="Provide a short greeting suitable for a Samut Songkhram travel assistant.",
-                        ),
-                    },
-                ],
-                temperature=self.greeting_temperature,
-                top_p=self.greeting_top_p,
-                max_completion_tokens=self.greeting_max_tokens,
-            )
-            return self._safe_extract_content(response)
+            return random.choice(self._greeting_pool(language))
         except Exception as exc:
-            print(f"[ERROR] Greeting generation failed: {exc}")
+            log.error("Greeting generation failed: %s", exc)
             if language == "th":
                 return "สวัสดีค่ะ! น้องปลาทูพร้อมช่วยวางแผนการเที่ยวสมุทรสงครามให้คุณค่ะ"
             return "Hello! I'm NongPlaToo, ready to help you plan your Samut Songkhram trip!"
 
+    def _greeting_pool(self, language: str) -> List[str]:
+        """Greeting variants for ``language``, generated in one n-choice request on first use and reused for cache_ttl."""
+        cache_key = (language, self.model_name)
+        with _GREETING_CACHE_LOCK:
+            cached = _GREETING_CACHE.get(cache_key)
+        if cached and time.monotonic() - cached[0] < self.greeting_cache_ttl:
+            return cached[1]
+
+        response = self._create_chat_completion(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": self._system_prompt(language)},
+                {"role": "user", "content": self.greeting_prompt},
+            ],
+            temperature=self.greeting_temperature,
+            top_p=self.greeting_top_p,
+            max_completion_tokens=self.greeting_max_tokens,
+            n=self.greeting_pool_size,
+        )
+        variants = []
+        for choice in getattr(response, "choices", None) or []:
+            content = getattr(getattr(choice, "message", None), "content", None)
+            if isinstance(content, str) and content.strip():
+                variants.append(content.strip())
+        if not variants:
+            raise ValueError("empty greeting response")
+        if self.greeting_cache_ttl > 0:
+            with _GREETING_CACHE_LOCK:
+                _GREETING_CACHE[cache_key] = (time.monotonic(), variants)
+        return variants
+
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
 
     def _create_chat_completion(self, **kwargs: Any):
-        """Call chat.completions.create with compatibility fallback."""
+        """Call chat.completions.create, sharing one API call among identical concurrent requests."""
         if not self.client:
             raise RuntimeError("OpenAI client not initialized")
+        key = self._request_key(kwargs)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._inflight[key] = Future()
+        started = time.perf_counter()
+        if not is_leader:
+            response = future.result()
+            self._record_metrics(kwargs, response, started, status="ok", coalesced=True)
+            return response
+
+        try:
+            response = self._call_with_retries(kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            self._record_metrics(kwargs, None, started, status="error")
+            raise
+        else:
+            future.set_result(response)
+            self._record_metrics(kwargs, response, started, status="ok")
+            return response
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _stream_chat_completion(
+        self,
+        usage_sink: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        """Yield text deltas from a streamed completion; streams are never coalesced.
+
+        The final usage-only chunk (``stream_options.include_usage``) is stored in
+        ``usage_sink["usage"]`` when a sink is given.
+        """
+        if not self.client:
+            raise RuntimeError("OpenAI client not initialized")
+        started = time.perf_counter()
+        ttft: Optional[float] = None
+        stream = None
+        usage_chunk = None
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        # The read timeout bounds the wait for the first token (and any later stall). One
+        # attempt only: retrying a timed-out open would multiply the first-token watchdog.
+        kwargs.setdefault("timeout", self._stream_timeout)
+        try:
+            stream = self._call_with_retries({**kwargs, "stream": True}, attempts=1)
+            for chunk in stream:
+                if time.perf_counter() - started > self.generation_timeout:
+                    log.warning("Streamed completion exceeded %.0fs; truncating", self.generation_timeout)
+                    break
+                if getattr(chunk, "usage", None) is not None:
+                    usage_chunk = chunk
+                    if usage_sink is not None:
+                        usage_sink["usage"] = chunk.usage
+                choices = getattr(chunk, "choices", None)
+                if not choices:
+                    continue
+                delta = getattr(choices[0].delta, "content", None)
+                if not delta:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                yield delta
+        except GeneratorExit:
+            self._record_metrics(kwargs, usage_chunk, started, status="cancelled", ttft=ttft)
+            raise
+        except BaseException as exc:
+            if ttft is None and isinstance(exc, _timeout_errors()):
+                self._record_metrics(kwargs, usage_chunk, started, status="first_token_timeout")
+                raise FirstTokenTimeout(
+                    f"No token within {self.first_token_timeout:.0f}s from {kwargs.get('model')}"
+                ) from exc
+            self._record_metrics(kwargs, usage_chunk, started, status="error", ttft=ttft)
+            raise
+        else:
+            self._record_metrics(kwargs, usage_chunk, started, status="ok", ttft=ttft)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    def _record_metrics(
+        kwargs: Dict[str, Any],
+        response: Any,
+        started: float,
+        *,
+        status: str,
+        coalesced: bool = False,
+        ttft: Optional[float] = None,
+    ) -> None:
+        """Emit one structured metrics line (and Prometheus samples when available) per call."""
+        elapsed = time.perf_counter() - started
+        if OPENAI_REQUESTS is not None:
+            OPENAI_REQUESTS.labels(status="coalesced" if coalesced else status).inc()
+            OPENAI_LATENCY.observe(elapsed)
+        if not METRICS_LOG.isEnabledFor(logging.INFO):
+            return
+        usage = getattr(response, "usage", None)
+        METRICS_LOG.info(json.dumps({
+            "model": kwargs.get("model"),
+            "status": status,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "total_ms": round(elapsed * 1000, 1),
+            "cached": coalesced,
+        }))
+
+    @staticmethod
+    def _request_key(kwargs: Dict[str, Any]) -> bytes:
+        return _digest(kwargs)
+
+    def _call_with_retries(self, kwargs: Dict[str, Any], *, attempts: Optional[int] = None):
+        """Throttle and send, retrying transient OpenAI errors under this instance's retry settings."""
+        kwargs = self._with_prompt_cache_key(kwargs)
+
+        def attempt():
+            self._throttle(kwargs)
+            return self._send_chat_completion(kwargs)
+
+        return call_with_retries(attempt, self._retry_settings(attempts))
+
+    async def _acreate_chat_completion(self, aclient: Any, **kwargs: Any):
+        """Async counterpart of _create_chat_completion with the same pacing and retry policy."""
+        kwargs = self._with_prompt_cache_key(kwargs)
+        started = time.perf_counter()
+
+        async def attempt():
+            # TokenBucket.acquire sleeps, so keep it off the event loop.
+            await asyncio.to_thread(self._throttle, kwargs)
+            try:
+                return await aclient.chat.completions.create(**kwargs)
+            except TypeError as exc:
+                fallback_kwargs = _max_tokens_fallback(kwargs, exc)
+                if fallback_kwargs is None:
+                    raise
+                return await aclient.chat.completions.create(**fallback_kwargs)
+
+        try:
+            response = await acall_with_retries(attempt, self._retry_settings())
+        except BaseException:
+            self._record_metrics(kwargs, None, started, status="error")
+            raise
+        self._record_metrics(kwargs, response, started, status="ok")
+        return response
+
+    def _retry_settings(self, attempts: Optional[int] = None) -> RetryPolicy:
+        """This instance's retry policy, optionally with a different attempt budget."""
+        return (attempts or self.retry_attempts, self.retry_initial_delay, self.retry_max_delay)
+
+    def _with_prompt_cache_key(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Tag the request with a stable prompt_cache_key derived from model + system prompt."""
+        messages = kwargs.get("messages") or []
+        if not messages or messages[0].get("role") != "system":
+            return kwargs
+        cache_id = (kwargs.get("model") or self.model_name, messages[0].get("content") or "")
+        key = self._cache_keys.get(cache_id)
+        if key is None:
+            seed = "\0".join(cache_id).encode("utf-8")
+            key = self._cache_keys[cache_id] = hashlib.blake2b(seed, digest_size=8).hexdigest()
+        extra_body = dict(kwargs.get("extra_body") or {})
+        extra_body.setdefault("prompt_cache_key", key)
+        return {**kwargs, "extra_body": extra_body}
+
+    def _send_chat_completion(self, kwargs: Dict[str, Any]):
+        """Single chat.completions.create call with max_tokens compatibility fallback."""
         try:
             return self.client.chat.completions.create(**kwargs)
         except TypeError as exc:
-            if "max_completion_tokens" in str(exc) and "max_completion_tokens" in kwargs:
-                fallback_kwargs = dict(kwargs)
-                fallback_kwargs["max_tokens"] = fallback_kwargs.pop("max_completion_tokens")
-                return self.client.chat.completions.create(**fallback_kwargs)
-            raise
+            fallback_kwargs = _max_tokens_fallback(kwargs, exc)
+            if fallback_kwargs is None:
+                raise
+            return self.client.chat.completions.create(**fallback_kwargs)
+
+    def _throttle(self, kwargs: Dict[str, Any]) -> None:
+        """Wait for request and token budget before hitting the API."""
+        if self._rps_bucket is not None:
+            self._rps_bucket.acquire(1)
+        if self._tpm_bucket is not None:
+            prompt_tokens = sum(
+                self._count_tokens(str(message.get("content") or ""))
+                for message in kwargs.get("messages", [])
+            )
+            completion_budget = (kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0) * kwargs.get("n", 1)
+            self._tpm_bucket.acquire(prompt_tokens + completion_budget)
+
+    def _load_encoding(self):
+        if tiktoken is None:
+            return None
+        try:
+            return tiktoken.encoding_for_model(self.model_name)
+        except KeyError:
+            pass  # model unknown to this tiktoken release; use the current default below
+        except Exception as exc:
+            log.warning("tiktoken encoding unavailable: %s", exc)
+            return None
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as exc:
+            log.warning("tiktoken encoding unavailable: %s", exc)
+            return None
+
+    def _count_tokens(self, text: str) -> int:
+        """Token count via tiktoken, or a rough 3-chars-per-token estimate without it."""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) // 3 + 1
 
     @staticmethod
     def _detect_language(text: str) -> str:
-        thai_chars = sum(1 for ch in text if "\u0e00" <= ch <= "\u0e7f")
-        return "th" if thai_chars > len(text) * 0.3 else "en"
+        # ASCII text (the usual English query) can't contain Thai; isascii() is a flag check.
+        if not text or text.isascii() or not THAI_CHAR_RE.search(text):
+            return "en"
+        return "th" if len(THAI_CHAR_RE.findall(text)) > len(text) * 0.3 else "en"
 
 
-    def _format_context_data(self, context_data: List[Dict[str, Any]], data_type: str) -> str:
+    def _format_context_data(
+        self,
+        context_data: List[Dict[str, Any]],
+        data_type: str,
+        *,
+        token_budget: Optional[int] = None,
+    ) -> str:
         if not context_data:
             return f"No verified {data_type} data available."
 
-        context_parts = [f"=== VERIFIED DATA ({data_type.upper()}) ===\n"]
-        for idx, item in enumerate(context_data[:5], 1):
-            name = item.get("place_name") or item.get("name") or "Unknown"
-            context_parts.append(f"\n[Place {idx}]")
-            context_parts.append(f"Name: {name}")
-
-            location = item.get("location", {}) or {}
-            district = location.get("district")
-            province = location.get("province")
-            if district and province:
-                context_parts.append(f"Location: {district}, {province}")
-            elif province:
-                context_parts.append(f"Location: {province}")
-
-            place_info = item.get("place_information", {}) or {}
-            detail = place_info.get("detail")
-            if detail:
-                context_parts.append(f"Description: {detail}")
-
-            entry_description = item.get("description")
-            if entry_description and entry_description != detail:
-                context_parts.append(f"Summary: {entry_description}")
-
-            opening_hours = place_info.get("opening_hours")
-            if opening_hours:
-                context_parts.append(f"Opening Hours: {opening_hours}")
-
-            contact = place_info.get("contact", {}) or {}
-            phones = contact.get("phones") or []
-            if phones:
-                context_parts.append(f"Contact: {', '.join(phones)}")
-            socials = contact.get("socials")
-            if socials:
-                if isinstance(socials, list):
-                    context_parts.append(f"Social: {', '.join(socials[:3])}")
-                else:
-                    context_parts.append(f"Social: {socials}")
+        items = context_data[:CONTEXT_MAX_ITEMS]
+        try:
+            cache_key: Optional[Tuple[Any, ...]] = (self.model_name, data_type, token_budget, _digest(items))
+        except (TypeError, ValueError):
+            cache_key = None
+        if cache_key is not None:
+            with _CONTEXT_CACHE_LOCK:
+                cached = _CONTEXT_CACHE.get(cache_key)
+                if cached is not None:
+                    _CONTEXT_CACHE.move_to_end(cache_key)
+                    return cached
 
-            category = item.get("category") or place_info.get("category_description")
-            if category:
-                context_parts.append(f"Category: {category}")
+        header, footer = self._banner(data_type)
+        blocks = [self._format_place_block(idx, item) for idx, item in enumerate(items, 1)]
+        if token_budget:
+            blocks = self._fit_context(
+                blocks,
+                token_budget - self._count_tokens(header) - self._count_tokens(footer),
+            )
+        rendered = "\n".join([header, *blocks, footer])
+        if cache_key is not None:
+            with _CONTEXT_CACHE_LOCK:
+                _CONTEXT_CACHE[cache_key] = rendered
+                if len(_CONTEXT_CACHE) > CONTEXT_CACHE_SIZE:
+                    _CONTEXT_CACHE.popitem(last=False)
+        return rendered
 
-            best_time = item.get("best_time") or place_info.get("best_time")
-            if best_time:
-                context_parts.append(f"Best Time: {best_time}")
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _banner(data_type: str) -> Tuple[str, str]:
+        """Header/footer framing the verified-data block, built once per data_type."""
+        return f"=== VERIFIED DATA ({data_type.upper()}) ===\n", "\n=== END DATA ==="
 
-            price = item.get("price_range") or place_info.get("price") or place_info.get("ticket_price")
-            if price:
-                context_parts.append(f"Cost: {price}")
+    def _fit_context(self, blocks: List[str], budget: int) -> List[str]:
+        """Drop trailing (least relevant) place blocks until the rest fits in ``budget`` tokens."""
+        counts = [self._count_tokens(block) for block in blocks]
+        total = sum(counts)
+        kept = len(blocks)
+        while kept > 1 and total > budget:
+            kept -= 1
+            total -= counts[kept]
+        if kept < len(blocks):
+            log.info("Context trimmed to %d/%d places (%d tokens, budget %d)", kept, len(blocks), total, budget)
+        return blocks[:kept]
 
-            tips = item.get("tips") or place_info.get("tips")
-            if tips:
-                if isinstance(tips, list):
-                    context_parts.append(f"Tips: {'; '.join(str(tip) for tip in tips[:3])}")
-                else:
-                    context_parts.append(f"Tips: {tips}")
+    @staticmethod
+    def _format_place_block(idx: int, item: Dict[str, Any]) -> str:
+        get = item.get
+        place_info = get("place_information") or _EMPTY
+        location = get("location") or _EMPTY
+        contact = place_info.get("contact") or _EMPTY
+        piget, locget = place_info.get, location.get
 
-            highlights = item.get("highlights") or place_info.get("highlights")
-            if highlights:
-                if isinstance(highlights, list):
-                    context_parts.append(f"Highlights: {'; '.join(str(h) for h in highlights[:3])}")
-                else:
-                    context_parts.append(f"Highlights: {highlights}")
+        name = get("place_name") or get("name") or "Unknown"
+        district = locget("district")
+        province = locget("province")
+        detail = _clip(piget("detail"), CONTEXT_DETAIL_MAX)
+        entry_description = _clip(get("description"), CONTEXT_DETAIL_MAX)
+        opening_hours = _clip(piget("opening_hours"), CONTEXT_HOURS_MAX)
+        phones = contact.get("phones")
+        socials = contact.get("socials")
+        category = get("category") or piget("category_description")
+        best_time = get("best_time") or piget("best_time")
+        price = get("price_range") or piget("price") or piget("ticket_price")
+        tips = get("tips") or piget("tips")
+        highlights = get("highlights") or piget("highlights")
+        activities = get("activities") or piget("activities")
+        lat = locget("latitude")
+        lon = locget("longitude")
 
-            activities = item.get("activities") or place_info.get("activities")
-            if activities:
-                if isinstance(activities, list):
-                    context_parts.append(f"Activities: {'; '.join(str(a) for a in activities[:3])}")
-                else:
-                    context_parts.append(f"Activities: {activities}")
+        if district and province:
+            location_line = f"\nLocation: {district}, {province}"
+        elif province:
+            location_line = f"\nLocation: {province}"
+        else:
+            location_line = ""
+        summary = entry_description if entry_description and entry_description != detail else None
+
+        # One f-string per place: each optional line is either "\n<Label>: value" or "".
+        return (
+            f"\n[Place {idx}]\nName: {name}{location_line}"
+            f"{_line('Description', detail)}{_line('Summary', summary)}"
+            f"{_line('Opening Hours', opening_hours)}"
+            f"{_line('Contact', ', '.join(phones) if phones else None)}"
+            f"{_line('Social', _listed(socials, ', '))}"
+            f"{_line('Category', category)}{_line('Best Time', best_time)}{_line('Cost', price)}"
+            f"{_line('Tips', _listed(tips, '; '))}"
+            f"{_line('Highlights', _listed(highlights, '; '))}"
+            f"{_line('Activities', _listed(activities, '; '))}"
+            f"{_line('Coordinates', f'{lat}, {lon}' if lat and lon else None)}"
+        )
 
-            lat = location.get("latitude")
-            lon = location.get("longitude")
-            if lat and lon:
-                context_parts.append(f"Coordinates: {lat}, {lon}")
+    @staticmethod
+    def _stopped_at_length(response: Any) -> bool:
+        """True when the completion was cut off by its max_completion_tokens cap."""
+        choices = getattr(response, "choices", None)
+        return bool(choices) and getattr(choices[0], "finish_reason", None) == "length"
+
+    def _length_retry_request(self, request: Dict[str, Any], response: Any) -> Optional[Dict[str, Any]]:
+        """The request again with the default cap if ``response`` ran into a tighter per-intent cap."""
+        cap = request.get("max_completion_tokens") or 0
+        if not self._stopped_at_length(response) or cap >= self.max_completion_tokens:
+            return None
+        log.info("Answer hit the %d-token intent cap; retrying with %d", cap, self.max_completion_tokens)
+        return {**request, "max_completion_tokens": self.max_completion_tokens}
 
-        context_parts.append("\n=== END DATA ===")
-        return "\n".join(context_parts)
+    @staticmethod
+    def _trim_to_sentence(text: str) -> str:
+        """Drop a trailing partial sentence from a truncated answer (kept whole if none ends)."""
+        end = 0
+        for match in SENTENCE_END_RE.finditer(text):
+            end = match.end()
+        return text[:end].strip() if end else text
 
     @staticmethod
     def _safe_extract_content(response: Any) -> str:
-        try:
-            return (response.choices[0].message.content or "").strip()
-        except Exception:
+        choices = getattr(response, "choices", None)
+        if not choices:
             return ""
+        content = getattr(getattr(choices[0], "message", None), "content", None)
+        return content.strip() if isinstance(content, str) else ""
 
     def _build_context_status_note(self, status: Optional[Dict[str, Any]], has_data: bool) -> str:
         if not status:
@@ -347,32 +1347,27 @@ class GPTService:
         }
 
     def _create_fallback_response(self, language: str, query: str) -> str:
-        fallback_prompts = self.answer_prompts.get("fallback", {})
-        if language == "th":
-            template = fallback_prompts.get(
-                "th",
-                "ขออภัยค่ะ ขณะนี้ระบบ AI ไม่พร้อมให้บริการ\n\nกรุณาลองใหม่อีกครั้งในภายหลัง และนี่คือคำถามของคุณ: {query}",
-            )
-        else:
-            template = fallback_prompts.get(
-                "en",
-                "Sorry, the AI system is currently unavailable.\n\nPlease try again later. Here is your question for reference: {query}",
-            )
-        return template.format(query=query)
+        return self._fallback_templates["th" if language == "th" else "en"].format(query=query)
 
     def extract_query_entities(self, query: str, dataset_summary: str) -> Dict[str, List[str]]:
-        """Use GPT to extract keywords/places that should match local data."""
+        """Use GPT to extract keywords/places that should match local data.
+
+        Successful extractions are cached for ``entities.cache_ttl`` seconds, so a repeated
+        question skips the round trip; failures are not cached and are retried next time.
+        """
         if not self.client:
             return {"keywords": [], "places": []}
 
-        character_hint = ""
-        if self.character_profile:
-            name = self.character_profile.get("name", "Nong Pla Too")
-            description = " ".join(self.character_profile.get("characteristics", []))
-            character_hint = f"You are {name}. {description}"
+        cache_key = (self.model_name, " ".join(query.lower().split()), _digest(dataset_summary))
+        if self.entity_cache_ttl > 0:
+            with _ENTITY_CACHE_LOCK:
+                cached = _ENTITY_CACHE.get(cache_key)
+                if cached and time.monotonic() - cached[0] < self.entity_cache_ttl:
+                    _ENTITY_CACHE.move_to_end(cache_key)
+                    return {name: list(values) for name, values in cached[1].items()}
 
         prompt = (
-            f"{character_hint}\n\n"
+            f"{self._character_hint()}\n\n"
             "You are a travel data matcher for Samut Songkhram.\n"
             "Dataset entries:\n"
             f"{dataset_summary}\n\n"
@@ -399,19 +1394,31 @@ class GPTService:
             start = content.find("{")
             end = content.rfind("}") + 1
             if start >= 0 and end > start:
-                parsed = json.loads(content[start:end])
-                return {
+                parsed = _json_loads(content[start:end])
+                result = {
                     "keywords": parsed.get("keywords", []),
                     "places": parsed.get("places", []),
                 }
+                if self.entity_cache_ttl > 0 and all(isinstance(values, list) for values in result.values()):
+                    with _ENTITY_CACHE_LOCK:
+                        _ENTITY_CACHE[cache_key] = (time.monotonic(), {name: list(values) for name, values in result.items()})
+                        _ENTITY_CACHE.move_to_end(cache_key)
+                        if len(_ENTITY_CACHE) > ENTITY_CACHE_SIZE:
+                            _ENTITY_CACHE.popitem(last=False)
+                return result
         except Exception as exc:
-            print(f"[WARN] Keyword extraction failed: {exc}")
+            log.warning("Keyword extraction failed: %s", exc)
         return {"keywords": [], "places": []}
 
+    def _character_hint(self) -> str:
+        if not self.character_profile:
+            return ""
+        name = self.character_profile.get("name", "Nong Pla Too")
+        description = " ".join(self.character_profile.get("characteristics", []))
+        return f"You are {name}. {description}"
+
     def _system_prompt(self, language: str) -> str:
-        if language == "th":
-            return self.system_prompts.get("th", "")
-        return self.system_prompts.get("en", self.system_prompts.get("th", ""))
+        return self._system_prompt_cache["th" if language == "th" else "en"]
 
 
 def test_gpt_service() -> None:
@@ -434,4 +1441,5 @@ def test_gpt_service() -> None:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
     test_gpt_service()
@@ -0,0 +1,27 @@
+"""Gunicorn settings for the production container (``gunicorn -c gunicorn.conf.py app:app``).
+
+Requests spend most of their time waiting on OpenAI, and /api/query/stream holds a
+connection open for the whole answer, so each worker runs a thread pool (gthread)
+instead of gunicorn's default single sync worker.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or min(multiprocessing.cpu_count() * 2 + 1, 8))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Long enough for a full streamed answer (models.json chat.generation_timeout is 90s).
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+accesslog = "-"
+
+
+def worker_exit(server, worker):
+    """Close the shared OpenAI connection pools (sync and per-event-loop async) when a worker shuts down."""
+    try:
+        from gpt_service import close_openai_clients
+    except ImportError:
+        return
+    close_openai_clients()
@@ -12,8 +12,9 @@ def reproduce_error():
     print("Initializing Chatbot...")
     bot = TravelChatbot()
     
-    # Mock GPTService to ensure it's used
-    bot.gpt_service = GPTService()
+    # Make sure a GPTService is attached; reuse the chatbot's own instance when it built one.
+    if bot.gpt_service is None:
+        bot.gpt_service = GPTService()
     
     # Force pure GPT response which calls generate_response with system_override
     print("Attempting to trigger pure GPT response...")
@@ -0,0 +1,159 @@
+"""Seed the ``tourist_places`` table from ``world_journey_ai/configs/Imagelink.json``.
+
+Places are streamed from the file with ``ijson`` when it is installed, bulk-loaded into a
+temporary staging table with ``COPY ... FROM STDIN`` in batches of ``BATCH_SIZE`` and then
+merged with a single ``INSERT ... SELECT ... ON CONFLICT (id) DO UPDATE``, so re-running
+the script refreshes existing places instead of duplicating them.  Run ``python verify_seed.py`` afterwards to check the result.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+from functools import lru_cache
+from itertools import islice
+from io import StringIO
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from world_journey_ai.utils import json_loads
+
+try:
+    import ijson
+except ImportError:  # optional: stream the seed file instead of loading it whole
+    ijson = None  # type: ignore
+
+DEFAULT_DATA_PATH = Path(__file__).resolve().parent / "world_journey_ai" / "configs" / "Imagelink.json"
+# Columns provided by the seed file; anything else (e.g. rating) is left untouched on update.
+SEED_COLUMNS = ("id", "name_th", "location", "images", "tags", "description")
+BATCH_SIZE = 1000
+STAGING_TABLE = "tourist_places_seed"
+JSON_COLUMNS = ("images", "tags")
+
+
+def _merge_sql() -> str:
+    columns = ", ".join(SEED_COLUMNS)
+    value_columns = [column for column in SEED_COLUMNS if column != "id"]
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in value_columns)
+    # json has no equality operator, so compare images/tags as jsonb.
+    compared = [f"{{0}}.{column}::jsonb" if column in JSON_COLUMNS else f"{{0}}.{column}" for column in value_columns]
+    current = ", ".join(c.format("tourist_places") for c in compared)
+    incoming = ", ".join(c.format("EXCLUDED") for c in compared)
+    # DISTINCT ON keeps one row per id (ON CONFLICT can't touch the same row twice); the WHERE
+    # skips rows that are already up to date, so a re-seed writes no dead tuples or WAL for them.
+    return (
+        f"INSERT INTO tourist_places ({columns}) "
+        f"SELECT DISTINCT ON (id) {columns} FROM {STAGING_TABLE} ORDER BY id "
+        f"ON CONFLICT (id) DO UPDATE SET {updates} "
+        f"WHERE ({current}) IS DISTINCT FROM ({incoming})"
+    )
+
+
+# SQL is fixed for the run, so build each statement once rather than per batch.
+CREATE_STAGING_SQL = f"CREATE TEMP TABLE {STAGING_TABLE} (LIKE tourist_places INCLUDING DEFAULTS) ON COMMIT DROP"
+COPY_SQL = f"COPY {STAGING_TABLE} ({', '.join(SEED_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+MERGE_SQL = _merge_sql()
+# Explicit ids don't advance the serial sequence; keep later ORM inserts from colliding.
+SETVAL_SQL = (
+    "SELECT setval(pg_get_serial_sequence('tourist_places', 'id'), "
+    "(SELECT COALESCE(MAX(id), 1) FROM tourist_places))"
+)
+# Positions of the JSON columns in SEED_COLUMNS, for the CSV encoder.
+_JSON_INDEXES = frozenset(i for i, column in enumerate(SEED_COLUMNS) if column in JSON_COLUMNS)
+
+
+def _to_row(place: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": int(place["id"]),
+        "name_th": place["name_th"],
+        "location": place.get("location"),
+        "images": place.get("images") or [],
+        "tags": place.get("tags") or [],
+        "description": place.get("description"),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_data_path() -> Path:
+    """Seed file to load: ``$SEED_DATA_PATH`` if set, else the bundled Imagelink.json (one stat, cached)."""
+    path = Path(os.getenv("SEED_DATA_PATH") or DEFAULT_DATA_PATH)
+    if not path.is_file():
+        raise FileNotFoundError(f"Seed file not found: {path} (set SEED_DATA_PATH)")
+    return path
+
+
+def iter_places(path: Optional[Path] = None) -> Iterator[Dict[str, Any]]:
+    """Yield place records one at a time (ijson), or from a whole-file parse when ijson is missing."""
+    path = path or get_data_path()
+    if ijson is not None:
+        with path.open("rb") as fh:
+            # use_float keeps numbers as float rather than Decimal, matching json.load.
+            yield from ijson.items(fh, "places.item", use_float=True)
+        return
+    raw = path.read_bytes()
+    data = json_loads(raw)
+    yield from data.get("places", [])
+
+
+def iter_rows(path: Optional[Path] = None) -> Iterator[Dict[str, Any]]:
+    """Valid seed rows, converted lazily as the parser produces places."""
+    return (_to_row(place) for place in iter_places(path) if place.get("id") and place.get("name_th"))
+
+
+def iter_row_batches(path: Optional[Path] = None, size: int = BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Chunks of at most ``size`` rows; only one chunk is held in memory at a time."""
+    rows = iter_rows(path)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_rows(cursor: Any, rows: List[Dict[str, Any]]) -> int:
+    """Stream ``rows`` into the staging table with one ``COPY FROM STDIN`` (CSV)."""
+    if not rows:
+        return 0
+    from world_journey_ai.db import json_dumps
+
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerows(
+        [json_dumps(row[column]) if i in _JSON_INDEXES else row[column] for i, column in enumerate(SEED_COLUMNS)]
+        for row in rows
+    )
+    buf.seek(0)
+    cursor.copy_expert(COPY_SQL, buf)
+    return len(rows)
+
+
+def merge_staged(cursor: Any) -> int:
+    """Upsert the staged rows into ``tourist_places`` in one statement; returns rows written."""
+    cursor.execute(MERGE_SQL)
+    written = cursor.rowcount
+    cursor.execute(SETVAL_SQL)
+    return written
+
+
+def main() -> None:
+    # Imported here so importing this module doesn't load SQLAlchemy or read .env.
+    from world_journey_ai.db import get_engine, init_db
+
+    data_path = get_data_path()
+    init_db()
+    count = 0
+    with get_engine().begin() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(CREATE_STAGING_SQL)
+            for rows in iter_row_batches(data_path):
+                count += copy_rows(cursor, rows)
+            written = merge_staged(cursor)
+        finally:
+            cursor.close()
+    print(f"[OK] Seeded {count} tourist_places from {data_path.name} ({written} inserted or changed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,21 @@ Semantic search for tourism queries using sentence embeddings
 Intelligent understanding without hardcoded keywords
 """
 
+import hashlib
+import importlib.util
+import json
 import os
 import sys
+from functools import lru_cache
+from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+# Phrase embeddings are cached here as .npy, keyed by model name + phrase hash.
+# "onnx" runs the encoder on onnxruntime's fused CPU kernels when available; "torch" forces PyTorch.
+SEMANTIC_BACKEND = os.getenv("SEMANTIC_BACKEND", "onnx").lower()
+EMBEDDING_CACHE_DIR = Path(os.getenv("SEMANTIC_CACHE_DIR") or Path.home() / ".cache" / "world_journey_ai")
+
 def safe_import():
     """Safely import dependencies with detailed error reporting"""
     try:
@@ -15,13 +26,13 @@ def safe_import():
         import numpy as np
         print("  ✓ NumPy loaded")
         
-        from sentence_transformers import SentenceTransformer
-        print("  ✓ SentenceTransformers loaded")
-        
-        from sklearn.metrics.pairwise import cosine_similarity
-        print("  ✓ Scikit-learn loaded")
+        # sentence-transformers pulls in torch; only check it is installed here and import
+        # it when a SemanticMatcher is actually built, so importing this module stays cheap.
+        if importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError("No module named 'sentence_transformers'")
+        print("  ✓ SentenceTransformers available")
         
-        return True, (np, SentenceTransformer, cosine_similarity)
+        return True, (np,)
         
     except ImportError as e:
         print(f"[ERROR] Missing dependency: {e}")
@@ -35,26 +46,37 @@ LIBRARIES_AVAILABLE, imports = safe_import()
 
 # Extract imports safely at module level
 if LIBRARIES_AVAILABLE and imports is not None:
-    np, SentenceTransformer, cosine_similarity = imports
+    (np,) = imports
 else:
     np = None
-    SentenceTransformer = None  
-    cosine_similarity = None
+
+# Phrases that mark a query as being about the province (encoded once in SemanticMatcher.__init__)
+SAMUTSONGKHRAM_PHRASES = [
+    # Thai
+    "สมุทรสงคราม", "จังหวัดสมุทรสงคราม", "เที่ยวสมุทรสงคราม",
+    "อัมพวา", "วัดบางกุ้ง", "คลองโคน", "คลองช่อง", "ตลาดน้ำ", "ตลาดร่มหุบ",
+    "ที่เที่ยวสมุทรสงคราม", "ท่องเที่ยวสมุทรสงคราม", "ป่าชายเลน",
+    # English
+    "Samut Songkhram", "Samut Songkhram province", "visit Samut Songkhram",
+    "tourism in Samut Songkhram", "Amphawa", "Wat Bang Kung", "Khlong Khone",
+    "floating market", "mangrove forest", "Maeklong railway market"
+]
 
 class SemanticMatcher:
     def __init__(self):
         """Initialize the semantic matcher with multilingual model"""
-        if not LIBRARIES_AVAILABLE or SentenceTransformer is None:
+        if not LIBRARIES_AVAILABLE:
             raise ImportError("Semantic search libraries not available")
             
         # Use module-level imports
         self.np = np
-        self.cosine_similarity = cosine_similarity
             
         try:
             # Use a smaller, faster multilingual model that works with Thai and English
             print("[INFO] Loading semantic model...")
-            self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+            self.model, self.backend = self._load_model()
+            # Repeated queries skip the transformer forward pass (per matcher, so per model).
+            self._encode_query = lru_cache(maxsize=1024)(self._encode_query_uncached)
             print("[OK] Semantic model loaded successfully")
             
             # Define knowledge areas with diverse example phrases
@@ -127,36 +149,146 @@ class SemanticMatcher:
                 ]
             }
             
-            # Pre-compute embeddings for all knowledge areas
+            # Pre-compute embeddings for all knowledge areas plus the province phrases in a
+            # single batched encode, then slice each area's rows back out.
             print("[INFO] Computing semantic embeddings...")
-            self.embeddings = {}
+            all_phrases: List[str] = []
+            offsets: List[Tuple[str, int, int]] = []
             for area, phrases in self.knowledge_areas.items():
-                self.embeddings[area] = self.model.encode(phrases)
+                offsets.append((area, len(all_phrases), len(all_phrases) + len(phrases)))
+                all_phrases.extend(phrases)
+            province_start = len(all_phrases)
+            all_phrases.extend(SAMUTSONGKHRAM_PHRASES)
+            # L2-normalised up front, so cosine similarity is a plain dot product at query time.
+            all_embeddings = self.np.ascontiguousarray(self._phrase_embeddings(all_phrases), dtype=self.np.float32)
+            # One contiguous (N, D) float32 matrix of every area phrase, with each area's first
+            # row index and a per-row area id, so a query is a single GEMV plus one reduceat.
+            self._area_names = [area for area, _, _ in offsets]
+            self._area_starts = self.np.array([start for _, start, _ in offsets], dtype=self.np.intp)
+            self._area_ids = self.np.repeat(
+                self.np.arange(len(offsets), dtype=self.np.int32),
+                [end - start for _, start, end in offsets],
+            )
+            self._area_matrix = all_embeddings[:province_start]
+            self.province_embeddings = all_embeddings[province_start:]
+            # Areas and province phrases share one matrix so classify() needs a single GEMV.
+            self._phrase_matrix = all_embeddings
+            self._province_start = province_start
+            # Per-area views into the same buffer (no copies).
+            self.embeddings = {area: self._area_matrix[start:end] for area, start, end in offsets}
             print("[OK] Semantic embeddings ready")
             
         except Exception as e:
             print(f"[ERROR] Failed to initialize semantic matcher: {e}")
             raise e
     
+    @staticmethod
+    def _load_model():
+        """Load the encoder: FP16 on CUDA when a GPU is present, else ONNX on CPU, else PyTorch on CPU."""
+        from sentence_transformers import SentenceTransformer
+
+        if os.getenv("SEMANTIC_DEVICE", "auto") != "cpu" and SemanticMatcher._cuda_available():
+            model = SentenceTransformer(MODEL_NAME, device="cuda")
+            model.half()
+            print("[OK] Semantic model on CUDA (fp16)")
+            return model, "cuda-fp16"
+
+        if SEMANTIC_BACKEND == "onnx":
+            try:
+                # backend="onnx" loads through optimum's ORTModel (sentence-transformers[onnx]).
+                import optimum.onnxruntime  # noqa: F401
+                model_kwargs = {"provider": "CPUExecutionProvider"}
+                onnx_file = os.getenv("SEMANTIC_ONNX_FILE")  # e.g. onnx/model_O2.onnx
+                if onnx_file:
+                    model_kwargs["file_name"] = onnx_file
+                return SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs=model_kwargs), "onnx"
+            except ImportError:
+                print("[INFO] optimum[onnxruntime] not installed (pip install 'sentence-transformers[onnx]'); using the PyTorch backend")
+            except Exception as e:  # older sentence-transformers without backend=, missing export, ...
+                print(f"[WARN] ONNX backend unavailable ({e}); using the PyTorch backend")
+        return SentenceTransformer(MODEL_NAME), "torch"
+
+    @staticmethod
+    def _cuda_available() -> bool:
+        try:
+            import torch
+        except ImportError:
+            return False
+        return bool(torch.cuda.is_available())
+
+    def _phrase_embeddings(self, phrases: List[str]):
+        """Normalised phrase embeddings, memory-mapped from the disk cache when already computed."""
+        digest = hashlib.sha1(json.dumps(phrases, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        cache_path = EMBEDDING_CACHE_DIR / f"embs_{MODEL_NAME}_{self.backend}_{digest}.npy"
+        if cache_path.exists():
+            try:
+                cached = self.np.load(cache_path, mmap_mode="r")
+                if cached.shape[0] == len(phrases):
+                    print(f"[OK] Loaded cached semantic embeddings: {cache_path.name}")
+                    return cached
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring unreadable embedding cache {cache_path}: {e}")
+
+        embeddings = self.model.encode(
+            phrases,
+            batch_size=128 if self.backend == "cuda-fp16" else 64,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        try:
+            EMBEDDING_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(".tmp.npy")
+            self.np.save(tmp_path, self.np.asarray(embeddings, dtype=self.np.float32))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"[WARN] Could not write embedding cache {cache_path}: {e}")
+        return embeddings
+
+    def _encode_query_uncached(self, query: str):
+        """Unit-length float32 query embedding (1-D), read-only because it is shared via the cache."""
+        embedding = self.model.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
+        embedding = embedding.astype(self.np.float32, copy=False)
+        embedding.setflags(write=False)
+        return embedding
+
+    def _scores(self, query: str):
+        """Best cosine similarity per knowledge area plus the province-phrase similarities.
+
+        One matmul over the shared phrase matrix, then a per-area max, so classify() and
+        find_best_match() always score a query the same way.
+        """
+        similarities = self._phrase_matrix @ self._encode_query(query)
+        area_scores = self.np.maximum.reduceat(similarities[:self._province_start], self._area_starts)
+        return area_scores, similarities[self._province_start:]
+
+    def classify(
+        self, query: str, threshold: float = 0.3, related_threshold: float = 0.25
+    ) -> Tuple[Optional[str], float, bool]:
+        """Best topic, its score and the Samut Songkhram check from one encode and one matmul."""
+        if not LIBRARIES_AVAILABLE or self.np is None:
+            return None, 0.0, False
+
+        try:
+            area_scores, province_scores = self._scores(query)
+            best_index = int(self.np.argmax(area_scores))
+            best_score = max(float(area_scores[best_index]), 0.0)
+            topic = self._area_names[best_index] if best_score >= threshold and best_score > 0.0 else None
+            related = float(self.np.max(province_scores)) >= related_threshold
+            return topic, best_score, related
+        except Exception as e:
+            print(f"[ERROR] Semantic classification failed: {e}")
+            return None, 0.0, False
+
     def find_best_match(self, query: str, threshold: float = 0.3) -> Tuple[Optional[str], float]:
         """Find the best matching knowledge area using semantic similarity"""
-        if not LIBRARIES_AVAILABLE or self.np is None or self.cosine_similarity is None:
+        if not LIBRARIES_AVAILABLE or self.np is None:
             return None, 0.0
             
         try:
-            query_embedding = self.model.encode([query])
-            
-            best_match = None
-            best_score = 0.0
-            
-            for area, area_embeddings in self.embeddings.items():
-                # Calculate similarity with all phrases in this area
-                similarities = self.cosine_similarity(query_embedding, area_embeddings)[0]
-                max_similarity = self.np.max(similarities)
-                
-                if max_similarity > best_score:
-                    best_score = max_similarity
-                    best_match = area
+            area_scores, _ = self._scores(query)
+            best_index = int(self.np.argmax(area_scores))
+            best_score = max(float(area_scores[best_index]), 0.0)
+            best_match = self._area_names[best_index] if best_score > 0.0 else None
             
             # Only return if confidence is above threshold
             if best_score >= threshold:
@@ -170,26 +302,12 @@ class SemanticMatcher:
     
     def is_samutsongkhram_related(self, query: str, threshold: float = 0.25) -> bool:
         """Check if query is related to Samutsongkhram using semantic similarity"""
-        if not LIBRARIES_AVAILABLE or self.np is None or self.cosine_similarity is None:
+        if not LIBRARIES_AVAILABLE or self.np is None:
             return False
             
         try:
-            samutsongkhram_phrases = [
-                # Thai
-                "สมุทรสงคราม", "จังหวัดสมุทรสงคราม", "เที่ยวสมุทรสงคราม",
-                "อัมพวา", "วัดบางกุ้ง", "คลองโคน", "คลองช่อง", "ตลาดน้ำ", "ตลาดร่มหุบ",
-                "ที่เที่ยวสมุทรสงคราม", "ท่องเที่ยวสมุทรสงคราม", "ป่าชายเลน",
-                # English
-                "Samut Songkhram", "Samut Songkhram province", "visit Samut Songkhram",
-                "tourism in Samut Songkhram", "Amphawa", "Wat Bang Kung", "Khlong Khone",
-                "floating market", "mangrove forest", "Maeklong railway market"
-            ]
-            
-            query_embedding = self.model.encode([query])
-            phrase_embeddings = self.model.encode(samutsongkhram_phrases)
-            
-            similarities = self.cosine_similarity(query_embedding, phrase_embeddings)[0]
-            max_similarity = self.np.max(similarities)
+            similarities = self.province_embeddings @ self._encode_query(query)
+            max_similarity = float(self.np.max(similarities))
             
             return max_similarity >= threshold
             
@@ -199,18 +317,12 @@ class SemanticMatcher:
     
     def get_similarity_scores(self, query: str) -> Dict[str, float]:
         """Get similarity scores for all knowledge areas (for debugging)"""
-        if not LIBRARIES_AVAILABLE or self.np is None or self.cosine_similarity is None:
+        if not LIBRARIES_AVAILABLE or self.np is None:
             return {}
             
         try:
-            query_embedding = self.model.encode([query])
-            scores = {}
-            
-            for area, area_embeddings in self.embeddings.items():
-                similarities = self.cosine_similarity(query_embedding, area_embeddings)[0]
-                scores[area] = float(self.np.max(similarities))
-            
-            return scores
+            area_scores, _ = self._scores(query)
+            return {area: float(score) for area, score in zip(self._area_names, area_scores)}
             
         except Exception as e:
             print(f"[ERROR] Failed to get similarity scores: {e}")
@@ -1,14 +1,38 @@
+import asyncio
 import json
 import os
 import sys
-import requests
 import io
-from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import httpx
+
+from world_journey_ai.utils import json_loads
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2 = True
+except ImportError:  # optional: multiplex checks to the same host over one connection
+    HTTP2 = False
 
 # Ensure stdout handles UTF-8
 if sys.stdout.encoding != 'utf-8':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# Image checks are network-bound: all of them run concurrently on one async client, with at
+# most CONCURRENCY in flight so the image hosts aren't hammered.
+CONCURRENCY = 8
+# 3.05 s to connect, 5 s for everything else, per attempt.
+REQUEST_TIMEOUT = httpx.Timeout(5.0, connect=3.05)
+# Transient gateway errors and network failures are retried RETRIES times with backoff.
+RETRIES = 2
+RETRY_STATUSES = (502, 503, 504)
+BACKOFF_SECONDS = 0.25
+# Most images live on one or two hosts: size the keep-alive pool to the concurrency so every
+# check after the first few reuses a warm TLS connection (or one HTTP/2 connection per host).
+LIMITS = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY, keepalive_expiry=30.0)
+
 def is_attraction(place):
     """Check if a place is likely a tourist attraction."""
     non_attraction_keywords = [
@@ -32,42 +56,45 @@ def find_image(place_name):
     # For this script, we will rely on manual additions and validation.
     return None
 
-def validate_image_url(url):
+async def validate_image_url(client, semaphore, url):
     """Check if an image URL is valid and accessible."""
     if not url:
         return False
-    try:
-        response = requests.head(url, timeout=5)
-        # Consider successful status codes and also 422 which some image hosts return for valid images
-        if response.status_code == 200 or response.status_code == 422:
-            return True
-        else:
+    async with semaphore:
+        for attempt in range(RETRIES + 1):
+            try:
+                response = await client.head(url)
+            except httpx.HTTPError as e:
+                if attempt < RETRIES:
+                    await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt)
+                    continue
+                print(f"Error checking URL {url}: {e}", file=sys.stderr)
+                return False
+            if response.status_code in RETRY_STATUSES and attempt < RETRIES:
+                await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt)
+                continue
+            # Consider successful status codes and also 422 which some image hosts return for valid images
+            if response.status_code == 200 or response.status_code == 422:
+                return True
             print(f"URL {url} failed with status code {response.status_code}", file=sys.stderr)
             return False
-    except requests.RequestException as e:
-        print(f"Error checking URL {url}: {e}", file=sys.stderr)
-        return False
 
-def process_place(place):
+async def validate_image_urls(urls):
+    """Validate every distinct URL concurrently; returns {url: is_valid}."""
+    unique = list(dict.fromkeys(url for url in urls if url))
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=LIMITS, http2=HTTP2) as client:
+        results = await asyncio.gather(*(validate_image_url(client, semaphore, url) for url in unique))
+    return dict(zip(unique, results))
+
+def process_place(place, valid_urls):
     """
-    Process a single place:
-    1. Check if it's an attraction.
+    Process a single attraction:
+    1. Keep only the images that passed validation (``valid_urls`` from validate_image_urls).
     2. If it has no images, try to find one (placeholder).
-    3. Validate existing images.
-    4. Return the place if it's a valid attraction with at least one valid image.
+    3. Return the place if it has at least one valid image.
     """
-    if not is_attraction(place):
-        print(f"Removing non-attraction: {place['name_th']}", file=sys.stderr)
-        return None
-
-    # Validate existing images
-    valid_images = []
-    if place.get("images"):
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            results = executor.map(validate_image_url, place["images"])
-            valid_images = [img for img, is_valid in zip(place["images"], results) if is_valid]
-
-    place["images"] = valid_images
+    place["images"] = [img for img in place.get("images") or [] if valid_urls.get(img)]
 
     if not place["images"]:
         # Placeholder for finding a new image if none are valid/exist
@@ -82,12 +109,19 @@ def process_place(place):
 
     return place
 
+@lru_cache(maxsize=1)
+def find_data_path():
+    """Locate Imagelink.json once: $IMAGELINK_PATH, then the repo copy next to this script."""
+    override = os.getenv("IMAGELINK_PATH")
+    path = Path(override) if override else Path(__file__).resolve().parent / "world_journey_ai" / "configs" / "Imagelink.json"
+    if not path.is_file():
+        raise FileNotFoundError(f"Imagelink.json not found at {path} (set IMAGELINK_PATH)")
+    return path
+
 def main():
-    file_path = "c:/Users/Tuchtuntan/Desktop/World.Journey.Ai/world_journey_ai/configs/Imagelink.json"
-    
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        raw = find_data_path().read_bytes()
+        data = json_loads(raw)
     except (FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Error reading or parsing JSON file: {e}", file=sys.stderr)
         return
@@ -136,10 +170,20 @@ def main():
         if not place.get("images") and place["id"] in image_map:
             place["images"] = image_map[place["id"]]
 
-    # Process all places in parallel
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        # Filter out None results from non-attractions or places without images
-        updated_places = [p for p in executor.map(process_place, original_places) if p is not None]
+    attractions = []
+    for place in original_places:
+        if is_attraction(place):
+            attractions.append(place)
+        else:
+            print(f"Removing non-attraction: {place['name_th']}", file=sys.stderr)
+
+    # Check every image of every attraction in one concurrent pass
+    valid_urls = asyncio.run(validate_image_urls(
+        url for place in attractions for url in place.get("images") or []
+    ))
+
+    # Filter out places left without images
+    updated_places = [p for p in (process_place(place, valid_urls) for place in attractions) if p is not None]
 
     data["places"] = updated_places
     
@@ -6,6 +6,8 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+from world_journey_ai.utils import json_loads
+
 
 class PromptRepo:
     """Central repository for prompts, parameters, and feature settings."""
@@ -89,8 +91,8 @@ class PromptRepo:
     def _load_json(self, relative_path: str) -> Dict[str, Any]:
         path = self._root / relative_path
         try:
-            with open(path, "r", encoding="utf-8") as handle:
-                return json.load(handle)
+            raw = path.read_bytes()
+            return json_loads(raw)
         except FileNotFoundError:
             print(f"[WARN] Config file missing: {path}")
         except json.JSONDecodeError as exc:
@@ -8,8 +8,9 @@ scripts or notebooks.
 
 from __future__ import annotations
 
+import json
 import os
-from typing import Dict, Generator, Iterable, List, cast as typing_cast
+from typing import Any, Dict, Generator, Iterable, List, cast as typing_cast
 
 try:
     from dotenv import load_dotenv
@@ -17,9 +18,11 @@ except ImportError:  # pragma: no cover - optional dependency during runtime
     load_dotenv = None  # type: ignore
 
 from sqlalchemy import JSON, Column, Float, Integer, String, Text, cast, create_engine, or_, select
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
+from world_journey_ai.utils import orjson
+
 if load_dotenv:
     # Automatically pull DATABASE_URL, OPENAI_API_KEY, etc. from .env files.
     load_dotenv()
@@ -165,10 +168,30 @@ _ENGINE: Engine | None = None
 _SESSION_FACTORY: sessionmaker | None = None
 
 
+def json_dumps(value: Any) -> str:
+    """Serializer for JSON columns: empty lists (most images/tags) skip encoding, orjson when available."""
+    if isinstance(value, list) and not value:
+        return "[]"
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False)
+
+
 def get_engine() -> Engine:
     global _ENGINE
     if _ENGINE is None:
-        _ENGINE = create_engine(get_db_url(), future=True, pool_pre_ping=True)
+        url = get_db_url()
+        options: Dict[str, object] = {}
+        if make_url(url).drivername in ("postgresql", "postgresql+psycopg2"):
+            # Multi-row VALUES for executemany INSERTs, psycopg2 execute_batch for UPDATE/DELETE.
+            options.update(executemany_mode="values_plus_batch", insertmanyvalues_page_size=1000)
+        _ENGINE = create_engine(
+            url,
+            future=True,
+            pool_pre_ping=True,
+            json_serializer=json_dumps,
+            **options,
+        )
     return _ENGINE
 
 
@@ -7,6 +7,7 @@ import os
 import unicodedata
 import hashlib
 import time
+from functools import cached_property, lru_cache, singledispatch
 from typing import Any, Dict, List, Optional, TYPE_CHECKING, Set, Tuple
 import re
 
@@ -14,21 +15,22 @@ from world_journey_ai.services.province_guides import PROVINCE_GUIDES, PROVINCE_
 from world_journey_ai.services.guides import build_bangkok_guides_html
 from world_journey_ai.services.messages import MessageStore
 from world_journey_ai.services.enhanced_knowledge import enhanced_knowledge, PlaceKnowledge
+from world_journey_ai.utils import json_loads as _json_loads
 
 from config_loader import get_config_value, get_prompts_config
 
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional dependency
+    ahocorasick = None
+
 PROMPTS_CONFIG = get_prompts_config()
 WORLD_SYSTEM_PROMPTS = get_config_value(PROMPTS_CONFIG, "world_journey_ai", "system_prompts", default={})
 
 if TYPE_CHECKING:
     from openai import OpenAI
 
-try:
-    from openai import OpenAI as OpenAIClient
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    OpenAIClient = None  # type: ignore
+
 
 TRAVEL_KEYWORDS = (
     # Thai - Basic travel terms
@@ -73,6 +75,65 @@ SAMUTSONGKHRAM_ONLY_MESSAGE = (
     "ลองถามเกี่ยวกับสถานที่เหล่านี้ดูค่ะ!"
 )
 
+# Intent classification for _optimize_query_understanding, in priority order. Each intent's
+# English and Thai alternatives are unioned into one pattern compiled at import time.
+INTENT_PATTERNS = {
+    "planning": [
+        r"\b(plan|planning|itinerary|schedule|agenda|organize)\b",
+        r"\b(วางแผน|จัดทริป|กำหนดการ|ตารางเวลา)\b"
+    ],
+    "recommendation": [
+        r"\b(recommend|suggest|advise|what.*visit|where.*go)\b",
+        r"\b(แนะนำ|เสนอ|ช่วย|ไปไหน|ที่ไหน)\b"
+    ],
+    "information": [
+        r"\b(about|information|details|tell me|what is)\b",
+        r"\b(เกี่ยวกับ|ข้อมูล|รายละเอียด|บอก|คือ)\b"
+    ],
+    "comparison": [
+        r"\b(versus|vs|compare|difference|better)\b",
+        r"\b(เทียบ|เปรียบเทียบ|ต่าง|ดีกว่า)\b"
+    ]
+}
+_INTENT_PATTERNS = {
+    intent: re.compile("|".join(patterns), re.IGNORECASE) for intent, patterns in INTENT_PATTERNS.items()
+}
+
+# Input screening for _validate_and_preprocess_input. Plain literals are checked with ``in`` on
+# the lowercased text; only the patterns that need regex features go through the regex engine.
+UNSAFE_SUBSTRINGS = ("javascript:", "data:text/html", "vbscript:")
+UNSAFE_RE = re.compile(
+    r"<script[^>]*>.*?</script>"  # Script injection
+    r"|on\w+\s*=",  # Event handlers
+    re.IGNORECASE,
+)
+SPAM_RE = re.compile(
+    r"^\s*[!@#$%^&*()_+={}\[\]|\\:\";\'<>?,./-]+\s*$"  # Only special characters
+    r"|^(.)\1{10,}$"  # Repeated characters
+    r"|^(?:test|testing|123|aaa|xxx)\s*$",  # Test strings
+    re.IGNORECASE,
+)
+# Question cues for _calculate_travel_relevance; each matching cue adds 0.5.
+QUESTION_RES = (
+    re.compile(r"\b(where|what|how|when|which|who)\b"),
+    re.compile(r"\b(ไป|เที่ยว|ที่ไหน|อยากไป|แนะนำ|ช่วย)\b"),
+)
+
+
+@lru_cache(maxsize=2048)
+def _detect_intent(normalized_query: str) -> str:
+    """First intent (in priority order) whose pattern matches, else "general"; cached per query."""
+    return next(
+        (intent for intent, pattern in _INTENT_PATTERNS.items() if pattern.search(normalized_query)),
+        "general",
+    )
+
+# Activity types picked out by _extract_query_entities (already lowercase).
+ACTIVITY_KEYWORDS = (
+    "beach", "ชายหาด", "temple", "วัด", "mountain", "ภูเขา",
+    "food", "อาหาร", "shopping", "ช้อปปิ้ง", "culture", "วัฒนธรรม"
+)
+
 
 CATEGORY_LABELS = [
     "สถานที่ศักดิ์สิทธิ์และประวัติศาสตร์",
@@ -83,6 +144,100 @@ CATEGORY_LABELS = [
 ]
 
 
+def _response_output_text(response: Any) -> Optional[str]:
+    text = response.output_text
+    if isinstance(text, str):
+        text = text.strip()
+        if text:
+            return text
+    return None
+
+
+def _chat_completion_text(response: Any) -> Optional[str]:
+    choices = response.choices
+    if choices and choices[0].message:
+        content = choices[0].message.content
+        if isinstance(content, str):
+            return content
+    return None
+
+
+@singledispatch
+def _text_node(node: Any) -> Tuple[Optional[str], Any]:
+    """Split one output-tree node into (text leaf, children); SDK objects are read by attribute."""
+    content = getattr(node, "content", None)
+    if content is not None:
+        return None, content
+    text = getattr(node, "text", None)
+    if not isinstance(text, str):
+        text = getattr(text, "value", None) or getattr(text, "text", None)
+    return (text if isinstance(text, str) and text else None), None
+
+
+@_text_node.register(str)
+def _(node: str) -> Tuple[Optional[str], Any]:
+    return (node or None), None
+
+
+@_text_node.register(list)
+def _(node: list) -> Tuple[Optional[str], Any]:
+    return None, node
+
+
+@_text_node.register(dict)
+def _(node: dict) -> Tuple[Optional[str], Any]:
+    if "content" in node:
+        return None, node["content"]
+    text = node.get("text")
+    if isinstance(text, dict):
+        text = text.get("value") or text.get("text")
+    return (text if isinstance(text, str) and text else None), None
+
+
+def _build_term_automaton(groups: Dict[str, List[str]]) -> Optional[Any]:
+    """One Aho-Corasick automaton over several literal term lists (None without pyahocorasick).
+
+    Each word's payload is ``(word, {group: occurrences})``, so hit counts match a per-term
+    ``term in text`` loop over the original lists.
+    """
+    if ahocorasick is None:
+        return None
+    owners: Dict[str, Dict[str, int]] = {}
+    for group, terms in groups.items():
+        for term in terms:
+            if term:
+                counts = owners.setdefault(term, {})
+                counts[group] = counts.get(group, 0) + 1
+    automaton = ahocorasick.Automaton()
+    for term, counts in owners.items():
+        automaton.add_word(term, (term, counts))
+    automaton.make_automaton()
+    return automaton
+
+
+def _walk_text(root: Any) -> List[str]:
+    """Collect text leaves from Responses output in document order, descending only through ``content``."""
+    chunks: List[str] = []
+    stack = [root]
+    while stack:
+        text, children = _text_node(stack.pop())
+        if text:
+            chunks.append(text)
+        if isinstance(children, list):
+            stack.extend(reversed(children))
+        elif children is not None:
+            stack.append(children)
+    return chunks
+
+
+# Direct accessors for the SDK response types we actually receive; anything else
+# (or an unexpected shape) goes through the generic waterfall.
+_OPENAI_TEXT_EXTRACTORS = {
+    "Response": _response_output_text,
+    "ChatCompletion": _chat_completion_text,
+}
+
+
 class BaseAIEngine:
     """Base class for AI engines with enhanced role memory and persistent behavior"""
     
@@ -92,6 +247,10 @@ class BaseAIEngine:
         self._ai_mode = ai_mode  # "chat", "guide", or "general"
         self._normalized_dest_names = [self._normalize(item["name"]) for item in destinations]
         self._normalized_keywords = [self._normalize(keyword) for keyword in TRAVEL_KEYWORDS]
+        self._lower_dest_names = [(item["name"].lower(), item["name"]) for item in destinations if item.get("name")]
+        self._travel_automaton = _build_term_automaton(
+            {"keyword": self._normalized_keywords, "destination": self._normalized_dest_names}
+        )
         
         # Initialize enhanced knowledge system
         self.enhanced_knowledge = enhanced_knowledge
@@ -124,18 +283,32 @@ class BaseAIEngine:
         self._cache_max_age = 3600  # 1 hour cache timeout
         self._cache_max_size = 1000  # Maximum cache entries
         
-        # Initialize OpenAI client if available
-        self._openai_client = None
-        if OPENAI_AVAILABLE:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if api_key:
-                try:
-                    self._openai_client = OpenAIClient(api_key=api_key)  # type: ignore
-                except Exception:
-                    pass
         self._openai_model = os.getenv("CHATBOT_OPENAI_MODEL") or os.getenv("OPENAI_MODEL") or "gpt-4o"
+        # Per-request deadline for every engine call, so a stalled API can't hold a worker
+        # for the pooled client's full read timeout on each retry in _create_openai_response.
+        self._openai_timeout = float(os.getenv("CHATBOT_OPENAI_TIMEOUT") or 30)
         self._province_aliases = self._build_province_aliases()
 
+    @cached_property
+    def _openai_client(self) -> Optional["OpenAI"]:
+        """Process-wide OpenAI client for the API key, resolved on first use.
+
+        Engines share gpt_service's pooled keep-alive client rather than each opening its own
+        connection pool; it is built with ``max_retries=0`` since _create_openai_response retries
+        through gpt_service.call_with_retries.
+        """
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        try:
+            from gpt_service import get_openai_client
+        except ImportError:
+            return None
+        try:
+            return get_openai_client(api_key)
+        except Exception:
+            return None
+
     def _format_responses_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Normalize legacy chat-completion messages for the Responses API."""
         formatted: List[Dict[str, Any]] = []
@@ -177,83 +350,73 @@ class BaseAIEngine:
             request_kwargs["max_output_tokens"] = max_tokens
 
         request_kwargs["model"] = model or self._openai_model or "gpt-4o"
+        request_kwargs.setdefault("timeout", self._openai_timeout)
         request_kwargs["input"] = self._format_responses_messages(messages)
-        return self._openai_client.responses.create(**request_kwargs)
+
+        from gpt_service import call_with_retries
+
+        return call_with_retries(lambda: self._openai_client.responses.create(**request_kwargs))
 
     def _extract_openai_text(self, response: Any) -> str:
         """Extract the assistant text from a Responses API result."""
         if not response:
             return ""
 
+        extractor = _OPENAI_TEXT_EXTRACTORS.get(type(response).__name__)
+        if extractor is not None:
+            text = extractor(response)
+            if text is not None:
+                return text
+        return self._extract_openai_text_slow(response)
+
+    def _extract_openai_text_slow(self, response: Any) -> str:
+        """Shape-agnostic fallback for responses the direct extractors don't cover."""
         output_text = getattr(response, "output_text", None)
         if isinstance(output_text, str) and output_text.strip():
             return output_text.strip()
 
-        text_chunks: List[str] = []
-        output_attr = getattr(response, "output", None)
-        if output_attr:
-            for output_item in output_attr:
-                content_list = getattr(output_item, "content", None) or []
-                for content_item in content_list:
-                    text_value = None
-                    if hasattr(content_item, "text"):
-                        text_field = getattr(content_item, "text")
-                        if isinstance(text_field, str):
-                            text_value = text_field
-                        else:
-                            text_value = getattr(text_field, "value", None) or getattr(text_field, "text", None)
-                    elif isinstance(content_item, dict):
-                        text_data = content_item.get("text")
-                        if isinstance(text_data, dict):
-                            text_value = text_data.get("value") or text_data.get("text")
-                        elif isinstance(text_data, str):
-                            text_value = text_data
-                    elif isinstance(content_item, str):
-                        text_value = content_item
-
-                    if text_value:
-                        text_chunks.append(text_value)
-            if text_chunks:
-                return "\n".join(chunk for chunk in text_chunks if chunk).strip()
-
-        choices = getattr(response, "choices", None)
-        if choices:
-            first_choice = choices[0]
-            message = getattr(first_choice, "message", None)
-            if message:
-                content = getattr(message, "content", "")
-                if isinstance(content, str):
-                    return content
-                if isinstance(content, list):
-                    combined = [str(part) for part in content if part]
-                    if combined:
-                        return "\n".join(combined)
-
-        response_dump = None
-        if hasattr(response, "model_dump"):
+        if isinstance(response, dict):
+            response_dump = response
+        elif hasattr(response, "model_dump"):
             try:
                 response_dump = response.model_dump()
             except Exception:
-                response_dump = None
-        elif isinstance(response, dict):
-            response_dump = response
+                return ""
+        else:
+            return self._extract_openai_text_attrs(response)
+        if not isinstance(response_dump, dict):
+            return ""
 
-        if isinstance(response_dump, dict):
-            outputs = response_dump.get("output") or response_dump.get("outputs")
-            if outputs:
-                text_chunks = []
-                for item in outputs:
-                    for content in item.get("content") or []:
-                        text_data = content.get("text")
-                        if isinstance(text_data, dict):
-                            value = text_data.get("value") or text_data.get("text")
-                        else:
-                            value = text_data
-                        if value:
-                            text_chunks.append(value)
-                if text_chunks:
-                    return "\n".join(text_chunks).strip()
+        text_chunks = _walk_text(response_dump.get("output") or response_dump.get("outputs"))
+        if text_chunks:
+            return "\n".join(text_chunks).strip()
 
+        choices = response_dump.get("choices")
+        if choices:
+            content = (choices[0].get("message") or {}).get("content")
+            if isinstance(content, str):
+                return content
+            if isinstance(content, list):
+                combined = [str(part) for part in content if part]
+                if combined:
+                    return "\n".join(combined)
+        return ""
+
+    def _extract_openai_text_attrs(self, response: Any) -> str:
+        """Attribute walk for SDK-like objects that can't be dumped to a dict."""
+        text_chunks = _walk_text(getattr(response, "output", None))
+        if text_chunks:
+            return "\n".join(text_chunks).strip()
+        choices = getattr(response, "choices", None)
+        if choices:
+            message = getattr(choices[0], "message", None)
+            content = getattr(message, "content", None)
+            if isinstance(content, str):
+                return content
+            if isinstance(content, list):
+                combined = [str(part) for part in content if part]
+                if combined:
+                    return "\n".join(combined)
         return ""
 
     def _get_ai_personality(self) -> Dict[str, str]:
@@ -411,29 +574,14 @@ class BaseAIEngine:
         if len(cleaned) > 1000:
             return {"error": "ข้อความยาวเกินไป กรุณาใส่ไม่เกิน 1000 ตัวอักษร"}
         
-        # Step 2: Security validation
-        suspicious_patterns = [
-            r'<script[^>]*>.*?</script>',  # Script injection
-            r'javascript:',               # JavaScript URLs
-            r'data:text/html',           # Data URLs
-            r'vbscript:',                # VBScript
-            r'on\w+\s*=',               # Event handlers
-        ]
-        
-        for pattern in suspicious_patterns:
-            if re.search(pattern, cleaned, re.IGNORECASE):
-                return {"error": "ข้อความมีเนื้อหาที่ไม่ปลอดภัย"}
+        # Step 2: Security validation (JavaScript/Data/VBScript URLs, script tags, event handlers)
+        cleaned_lower = cleaned.lower()
+        if any(marker in cleaned_lower for marker in UNSAFE_SUBSTRINGS) or UNSAFE_RE.search(cleaned):
+            return {"error": "ข้อความมีเนื้อหาที่ไม่ปลอดภัย"}
         
         # Step 3: Content type validation
-        spam_patterns = [
-            r'^\s*[!@#$%^&*()_+={}\[\]|\\:";\'<>?,./-]+\s*$',  # Only special characters
-            r'^(.)\1{10,}$',                                    # Repeated characters
-            r'^(test|testing|123|aaa|xxx)\s*$',                # Test strings
-        ]
-        
-        for pattern in spam_patterns:
-            if re.search(pattern, cleaned, re.IGNORECASE):
-                return {"error": "กรุณาใส่คำถามเกี่ยวกับการท่องเที่ยว"}
+        if SPAM_RE.search(cleaned):
+            return {"error": "กรุณาใส่คำถามเกี่ยวกับการท่องเที่ยว"}
         
         # Step 4: Language detection and normalization
         processed_text = self._normalize_input_text(cleaned)
@@ -509,33 +657,15 @@ class BaseAIEngine:
         text_lower = text.lower()
         normalized_text = self._normalize(text)
         
-        # Travel keyword scoring
-        travel_score = 0.0
-        total_keywords = len(self._normalized_keywords)
-        
-        for keyword in self._normalized_keywords:
-            if keyword in normalized_text:
-                travel_score += 1.0
-        
-        # Destination scoring
-        destination_score = 0.0
-        total_destinations = len(self._normalized_dest_names)
-        
-        for dest in self._normalized_dest_names:
-            if dest in normalized_text:
-                destination_score += 2.0  # Destinations are more important
+        # Travel keyword and destination scoring
+        keyword_hits, destination_hits = self._travel_term_hits(normalized_text)
+        travel_score = float(keyword_hits)
+        destination_score = 2.0 * destination_hits  # Destinations are more important
         
         # Question pattern scoring
-        question_patterns = [
-            r'\b(where|what|how|when|which|who)\b',
-            r'\b(ไป|เที่ยว|ที่ไหน|อยากไป|แนะนำ|ช่วย)\b',
-            r'\?',
-        ]
-        
-        question_score = 0.0
-        for pattern in question_patterns:
-            if re.search(pattern, text_lower):
-                question_score += 0.5
+        question_score = 0.5 * sum(1 for pattern in QUESTION_RES if pattern.search(text_lower))
+        if "?" in text_lower:
+            question_score += 0.5
         
         # Calculate final relevance score
         max_possible_score = 5.0  # Reasonable maximum
@@ -544,6 +674,20 @@ class BaseAIEngine:
         
         return min(relevance, 1.0)
 
+    def _travel_term_hits(self, normalized_text: str) -> Tuple[int, int]:
+        """Number of travel keywords and destination names contained in ``normalized_text``."""
+        if self._travel_automaton is None:
+            return (
+                sum(1 for keyword in self._normalized_keywords if keyword in normalized_text),
+                sum(1 for dest in self._normalized_dest_names if dest in normalized_text),
+            )
+        found: Dict[str, Dict[str, int]] = {}
+        for _, (term, counts) in self._travel_automaton.iter(normalized_text):
+            found[term] = counts
+        keyword_hits = sum(counts.get("keyword", 0) for counts in found.values())
+        destination_hits = sum(counts.get("destination", 0) for counts in found.values())
+        return keyword_hits, destination_hits
+
     def _get_system_prompt(self, *, lang: str = "th") -> str:
         """Return configurable system prompt for base AI engine."""
         return get_config_value(WORLD_SYSTEM_PROMPTS, "chat", lang, default="")
@@ -908,7 +1052,11 @@ class BaseAIEngine:
             # user prompts removed per user request
             user_prompt = ""
 
-            # Multiple attempts with different parameters
+            from gpt_service import is_retryable_error
+
+            # Multiple attempts with different parameters when the answer comes back empty,
+            # unusable or rejected; transient transport errors are already retried inside
+            # _create_openai_response and end the loop.
             max_retries = 3
             for attempt in range(max_retries):
                 try:
@@ -923,7 +1071,6 @@ class BaseAIEngine:
                         ],
                         temperature=temperature,
                         max_completion_tokens=1200,  # Increased for enhanced responses with more details
-                        timeout=30,      # Timeout protection
                     )
 
                     content = self._extract_openai_text(response)
@@ -938,9 +1085,9 @@ class BaseAIEngine:
                         return parsed_response
                         
                 except Exception as retry_error:
+                    if is_retryable_error(retry_error) or attempt == max_retries - 1:
+                        raise
                     print(f"AI attempt {attempt + 1} failed: {retry_error}")
-                    if attempt == max_retries - 1:  # Last attempt
-                        raise retry_error
                     continue
 
             return {"success": False, "error": "All AI attempts failed"}
@@ -959,7 +1106,7 @@ class BaseAIEngine:
             if json_start >= 0 and json_end > json_start:
                 try:
                     json_str = content[json_start:json_end]
-                    data = json.loads(json_str)
+                    data = _json_loads(json_str)
                     
                     # Validate and fix JSON response
                     required_fields = ["location", "attractions", "summary"]
@@ -1126,34 +1273,8 @@ class BaseAIEngine:
 
     def _optimize_query_understanding(self, query: str) -> Dict[str, object]:
         """Advanced query optimization for better AI understanding"""
-        # Intent classification
-        intent_patterns = {
-            "planning": [
-                r"\b(plan|planning|itinerary|schedule|agenda|organize)\b",
-                r"\b(วางแผน|จัดทริป|กำหนดการ|ตารางเวลา)\b"
-            ],
-            "recommendation": [
-                r"\b(recommend|suggest|advise|what.*visit|where.*go)\b",
-                r"\b(แนะนำ|เสนอ|ช่วย|ไปไหน|ที่ไหน)\b"
-            ],
-            "information": [
-                r"\b(about|information|details|tell me|what is)\b",
-                r"\b(เกี่ยวกับ|ข้อมูล|รายละเอียด|บอก|คือ)\b"
-            ],
-            "comparison": [
-                r"\b(versus|vs|compare|difference|better)\b",
-                r"\b(เทียบ|เปรียบเทียบ|ต่าง|ดีกว่า)\b"
-            ]
-        }
-        
-        detected_intent = "general"
-        for intent, patterns in intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, query, re.IGNORECASE):
-                    detected_intent = intent
-                    break
-            if detected_intent != "general":
-                break
+        # Intent classification (patterns are case-insensitive, so the lowered query is the key)
+        detected_intent = _detect_intent(query.strip().lower())
         
         # Extract entities (locations, time, budget, etc.)
         entities = self._extract_query_entities(query)
@@ -1177,11 +1298,12 @@ class BaseAIEngine:
             "activity_types": []
         }
         
+        query_lower = query.lower()
+
         # Location extraction (simplified)
-        for dest in self._destinations:
-            dest_name = dest.get("name", "").lower()
-            if dest_name and dest_name in query.lower():
-                entities["locations"].append(dest.get("name", ""))
+        for dest_lower, dest_name in self._lower_dest_names:
+            if dest_lower in query_lower:
+                entities["locations"].append(dest_name)
         
         # Time expressions
         time_patterns = [
@@ -1207,13 +1329,8 @@ class BaseAIEngine:
             entities["budget_expressions"].extend(matches)
         
         # Activity types
-        activity_keywords = [
-            "beach", "ชายหาด", "temple", "วัด", "mountain", "ภูเขา",
-            "food", "อาหาร", "shopping", "ช้อปปิ้ง", "culture", "วัฒนธรรม"
-        ]
-        
-        for keyword in activity_keywords:
-            if keyword.lower() in query.lower():
+        for keyword in ACTIVITY_KEYWORDS:
+            if keyword in query_lower:
                 entities["activity_types"].append(keyword)
         
         return entities
@@ -1411,7 +1528,7 @@ class BaseAIEngine:
             json_end = content.rfind('}') + 1
             if json_start >= 0 and json_end > json_start:
                 json_str = content[json_start:json_end]
-                data = json.loads(json_str)
+                data = _json_loads(json_str)
                 
                 # Build HTML from AI response
                 html_content = self._build_ai_response_html(data)
@@ -1607,9 +1724,12 @@ class BaseAIEngine:
 
     def _looks_travel_related(self, user_input: str, destinations: Optional[List[Dict[str, str]]] = None) -> bool:
         normalized = self._normalize(user_input)
-        if any(keyword in normalized for keyword in self._normalized_keywords):
-            return True
-        if any(name in normalized for name in self._normalized_dest_names):
+        if self._travel_automaton is not None:
+            if next(self._travel_automaton.iter(normalized), None) is not None:
+                return True
+        elif any(keyword in normalized for keyword in self._normalized_keywords) or any(
+            name in normalized for name in self._normalized_dest_names
+        ):
             return True
         if destinations:  # If we have destination matches, it's travel-related
             return True
@@ -6,6 +6,8 @@ import json
 from pathlib import Path
 from typing import Any, Dict, List
 
+from world_journey_ai.utils import json_loads
+
 CONFIG_DIR = Path(__file__).resolve().parent.parent / "configs"
 SAMUT_FILE = CONFIG_DIR / "SamutSongkhram.json"
 
@@ -15,8 +17,8 @@ def _load_json(path: Path) -> Dict[str, Any]:
         print(f"[WARN] Province config not found: {path}")
         return {}
     try:
-        with open(path, "r", encoding="utf-8") as handle:
-            return json.load(handle)
+        raw = path.read_bytes()
+        return json_loads(raw)
     except (json.JSONDecodeError, OSError) as exc:
         print(f"[WARN] Cannot load province config {path}: {exc}")
         return {}
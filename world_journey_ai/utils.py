@@ -0,0 +1,27 @@
+"""Small helpers shared by the app, the services and the offline scripts."""
+
+from __future__ import annotations
+
+import json
+import re
+from types import MappingProxyType
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Shared read-only stand-in for missing nested dicts, so lookups never allocate an empty {}.
+EMPTY = MappingProxyType({})
+THAI_CHAR_RE = re.compile("[\u0e00-\u0e7f]")
+
+
+def json_loads(text: Any) -> Any:
+    """Parse JSON (str or bytes) with orjson when installed, stdlib json otherwise.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)